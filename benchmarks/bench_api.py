@@ -0,0 +1,221 @@
+"""
+Load test for the main API routes, run in-process against a seeded SQLite database.
+
+Seeds users/persons/contacts, then drives each scenario at a fixed concurrency through an ASGI client and
+reports p50/p95/p99 latency, throughput and SQL statements per request (from the metrics middleware).
+Results are written to benchmarks/results/<commit>.json; pass --compare with an older file to see the change.
+
+    python -m benchmarks.bench_api --users 5 --contacts 20000 --requests 500 --concurrency 16
+    python -m benchmarks.bench_api --compare benchmarks/results/<old commit>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import random
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+RESULTS_DIR = pathlib.Path(__file__).parent / "results"
+PASSWORD = "secret1"
+
+
+def sqlite_engine(db_path: str):
+    """aiosqlite engine with foreign keys enforced, so ON DELETE CASCADE works as on PostgreSQL."""
+    from sqlalchemy import event
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def enable_foreign_keys(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    return engine
+
+
+async def seed(engine, users: int, persons: int, contacts: int):
+    """Bulk inserts the data set; every user gets the same number of persons and contacts."""
+    from sqlalchemy import insert
+
+    from src.database.models import Base, User, Person, Contact
+    from src.services.auth import auth_service
+
+    rnd = random.Random(42)
+    password = auth_service.pwd_context.hash(PASSWORD)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User), [
+            {"id": u, "username": f"user{u:05d}", "email": f"user{u}@example.com", "password": password}
+            for u in range(1, users + 1)
+        ])
+        now = datetime.now()
+        for u in range(users):
+            first_person = u * persons + 1
+            await conn.execute(insert(Person), [
+                {"id": first_person + p, "first_name": f"Name{p}", "last_name": f"Surname{p % 97}",
+                 "user_id": u + 1, "created_at": now, "updated_at": now}
+                for p in range(persons)
+            ])
+            rows = []
+            for n in range(contacts):
+                born = date(1960, 1, 1) + timedelta(days=rnd.randrange(365 * 40))
+                rows.append({
+                    "date_of_birth": born, "bday_md": born.month * 100 + born.day,
+                    "email": f"c{u}_{n}@example.com", "phone": f"+380{u:03d}{n:07d}", "note": f"note {n % 50}",
+                    "blocked": False, "person_id": first_person + n % persons, "user_id": u + 1,
+                    "created_at": now, "updated_at": now,
+                })
+            for i in range(0, len(rows), 5000):
+                await conn.execute(insert(Contact), rows[i:i + 5000])
+
+
+async def login(client, user: int) -> str:
+    response = await client.post("/api/auth/login",
+                                 data={"username": f"user{user}@example.com", "password": PASSWORD})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def scenarios(tokens: list[str], rnd: random.Random):
+    def auth():
+        return {"Authorization": f"Bearer {rnd.choice(tokens)}"}
+
+    return {
+        "contacts": lambda c: c.get("/api/contacts/", params={"limit": 100}, headers=auth()),
+        "search": lambda c: c.get("/api/contacts/search/", params={"find": f"Name{rnd.randrange(100)}"},
+                                  headers=auth()),
+        "birthday": lambda c: c.get("/api/contacts/birthday/", params={"limit": 100}, headers=auth()),
+        "persons": lambda c: c.get("/api/persons/", params={"limit": 100}, headers=auth()),
+        "login": lambda c: c.post("/api/auth/login", data={"username": f"user{rnd.randrange(1, len(tokens) + 1)}"
+                                                                       f"@example.com", "password": PASSWORD}),
+    }
+
+
+async def run_scenario(client, make_request, requests: int, concurrency: int) -> dict:
+    from src.services import metrics
+
+    from benchmarks.utils import summarize
+
+    metrics.request_metrics = metrics.RequestMetrics()
+    latencies, errors, remaining = [], 0, iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            response = await make_request(client)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 500:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    recorded = metrics.request_metrics
+    handled = sum(recorded.count.values())
+    return {
+        **summarize(latencies),
+        "rps": round(requests / elapsed, 1),
+        "queries_per_request": round(sum(recorded.statements.values()) / handled, 2) if handled else 0,
+        "errors": errors,
+    }
+
+
+async def run(args) -> dict:
+    import httpx
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    from main import app
+    from src.database.db import get_db
+    from src.services.metrics import instrument_engine
+
+    db_path = args.database or os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = sqlite_engine(db_path)
+    instrument_engine(engine)
+    session_maker = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async def get_bench_db():
+        async with session_maker() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = get_bench_db
+    started = time.perf_counter()
+    await seed(engine, args.users, args.persons, args.contacts)
+    print(f"seeded {args.users} users x {args.persons} persons / {args.contacts} contacts "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        tokens = [await login(client, user) for user in range(1, args.users + 1)]
+        rnd = random.Random(7)
+        for name, make_request in scenarios(tokens, rnd).items():
+            if args.only and name not in args.only:
+                continue
+            requests = args.requests if name != "login" else max(1, args.requests // 10)
+            results[name] = await run_scenario(client, make_request, requests, args.concurrency)
+            print(f"{name:>9}: " + "  ".join(f"{key}={value}" for key, value in results[name].items()))
+    await engine.dispose()
+    return results
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: dict, baseline_path: str) -> None:
+    baseline = json.loads(pathlib.Path(baseline_path).read_text())
+    print(f"\ncompared with {baseline['commit']}:")
+    for name, values in results.items():
+        old = baseline["results"].get(name)
+        if not old:
+            continue
+        changes = []
+        for key in ("p50_ms", "p99_ms", "rps", "queries_per_request"):
+            if old.get(key):
+                changes.append(f"{key} {(values[key] - old[key]) / old[key] * 100:+.1f}%")
+        print(f"{name:>9}: " + "  ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--persons", type=int, default=200)
+    parser.add_argument("--contacts", type=int, default=5000, help="contacts per user")
+    parser.add_argument("--requests", type=int, default=300, help="requests per scenario (login runs a tenth)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--bcrypt-rounds", type=int, help="lower the cost factor to keep the login scenario short")
+    parser.add_argument("--database", help="SQLite file to use instead of a temporary one")
+    parser.add_argument("--only", nargs="*", help="scenarios to run")
+    parser.add_argument("--compare", help="results file of an earlier run")
+    args = parser.parse_args()
+    if args.bcrypt_rounds:
+        # Read by Auth at import time
+        os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    # Saturated runs would log nearly every request as slow
+    os.environ.setdefault("SLOW_REQUEST_SECONDS", "60")
+
+    results = asyncio.run(run(args))
+    commit = current_commit()
+    RESULTS_DIR.mkdir(exist_ok=True)
+    path = RESULTS_DIR / f"{commit}.json"
+    path.write_text(json.dumps({"commit": commit, "date": datetime.now().isoformat(timespec="seconds"),
+                                "params": {k: v for k, v in vars(args).items() if k != "compare"},
+                                "results": results}, indent=2))
+    print(f"results saved to {path}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
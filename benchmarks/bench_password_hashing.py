@@ -0,0 +1,64 @@
+"""
+Login throughput vs. event loop responsiveness while passwords are being hashed.
+
+Runs a batch of concurrent bcrypt verifications either inline in the coroutine (the old behaviour)
+or through Auth's thread pool, while a probe task measures how late the loop wakes it up.
+The probe lag is what every other request on the worker would see as added latency.
+
+    python -m benchmarks.bench_password_hashing --logins 40 --rounds 12
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from benchmarks.utils import percentile
+
+
+async def probe(lags: list, stop: asyncio.Event, interval: float = 0.001):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - started - interval) * 1000)
+
+
+async def run(mode: str, logins: int):
+    from src.services.auth import auth_service
+
+    hashed = auth_service.pwd_context.hash("password")
+
+    async def login_inline():
+        auth_service.pwd_context.verify("password", hashed)
+
+    async def login_pooled():
+        await auth_service.verify_password("password", hashed)
+
+    login = login_inline if mode == "inline" else login_pooled
+    lags, stop = [], asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe_task
+    print(f"{mode:>7}: {logins / elapsed:7.1f} logins/s | probe lag ms "
+          f"p50={statistics.median(lags):7.2f} p99={percentile(lags, 99):7.2f} max={max(lags):7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    # Read by Auth at import time
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    os.environ["BCRYPT_WORKERS"] = str(args.workers)
+    for mode in ("inline", "pooled"):
+        asyncio.run(run(mode, args.logins))
+
+
+if __name__ == "__main__":
+    main()
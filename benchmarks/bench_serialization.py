@@ -0,0 +1,71 @@
+"""
+CPU cost of serializing one page of contacts: ORM objects through ContactResponse (what FastAPI does for
+response_model with orm_mode) against plain row dicts dumped by ORJSONResponse.
+
+    python -m benchmarks.bench_serialization --page 300 --repeat 200
+"""
+import argparse
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import parse_obj_as
+
+from src.database.models import Contact, Person
+from src.repository.contacts import contact_row
+from src.schemas import ContactResponse
+
+# Same labels as the columns of CONTACT_ROW_COLUMNS, stands in for SQLAlchemy's Row
+ContactRow = namedtuple("ContactRow", ["id", "date_of_birth", "email", "phone", "note", "blocked",
+                                       "person_id", "person_first_name", "person_last_name"])
+
+
+def make_page(size: int):
+    contacts, rows = [], []
+    born = datetime(1990, 1, 1)
+    for n in range(size):
+        person = Person(id=n % 50 + 1, first_name=f"Name{n % 50}", last_name=f"Surname{n % 50}")
+        contact = Contact(id=n + 1, date_of_birth=born + timedelta(days=n), email=f"contact{n}@example.com",
+                          phone=f"+38050{n:07d}", note=f"note {n}", blocked=False, person=person)
+        contacts.append(contact)
+        rows.append(ContactRow(contact.id, contact.date_of_birth, contact.email, contact.phone, contact.note,
+                               contact.blocked, person.id, person.first_name, person.last_name))
+    return contacts, rows
+
+
+def orm_path(contacts):
+    # Validation against the response model followed by jsonable_encoder, as FastAPI's serialize_response does
+    validated = parse_obj_as(List[ContactResponse], contacts)
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def rows_path(rows):
+    return ORJSONResponse([contact_row(row) for row in rows]).body
+
+
+def measure(func, arg, repeat: int) -> float:
+    started = time.process_time()
+    for _ in range(repeat):
+        func(arg)
+    return (time.process_time() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    contacts, rows = make_page(args.page)
+    orm_ms = measure(orm_path, contacts, args.repeat)
+    rows_ms = measure(rows_path, rows, args.repeat)
+    print(f"{args.page} contacts per page, CPU ms per page:")
+    print(f"  response_model + json: {orm_ms:8.3f}")
+    print(f"  rows + orjson:         {rows_ms:8.3f}  ({orm_ms / rows_ms:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
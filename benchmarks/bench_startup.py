@@ -0,0 +1,62 @@
+"""
+Cold start cost of the app: imports `main` in fresh interpreters with -X importtime and reports the total
+import time, the slowest top-level packages and whether the heavy optional ones were loaded at all.
+
+    python -m benchmarks.bench_startup --runs 10 --top 15
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+# Only needed once a request hashes a password, signs a token, validates an email or resolves an avatar
+HEAVY_MODULES = ("passlib", "bcrypt", "jose", "cryptography", "libgravatar", "email_validator", "asyncpg", "orjson")
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_profile(module: str) -> dict[str, tuple[int, int]]:
+    """Module -> (self, cumulative) microseconds of one cold import."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, check=True)
+    profile = {}
+    for match in LINE.finditer(result.stderr):
+        profile[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15, help="top-level packages to list")
+    args = parser.parse_args()
+
+    # Warm-up run, so the measured ones load bytecode from __pycache__ instead of compiling
+    import_profile(args.module)
+    totals, per_package = [], defaultdict(list)
+    for _ in range(args.runs):
+        profile = import_profile(args.module)
+        totals.append(profile[args.module][1] / 1000)
+        packages = defaultdict(int)
+        for name, (self_us, _) in profile.items():
+            packages[name.split(".")[0]] += self_us
+        for name, self_us in packages.items():
+            per_package[name].append(self_us / 1000)
+        loaded = profile
+
+    print(f"import {args.module}: median {statistics.median(totals):.1f} ms, min {min(totals):.1f} ms "
+          f"over {args.runs} runs")
+    print("\nslowest packages (median self time, ms):")
+    medians = {name: statistics.median(times) for name, times in per_package.items()}
+    for name, value in sorted(medians.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<24} {value:8.1f}")
+    print("\nheavy modules imported at startup:")
+    for name in HEAVY_MODULES:
+        print(f"  {name:<24} {'yes' if name in loaded else 'no'}")
+
+
+if __name__ == "__main__":
+    main()
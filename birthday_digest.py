@@ -0,0 +1,32 @@
+"""
+Daily batch job: precomputes the upcoming birthdays of every user for /api/contacts/birthday/.
+Run it once a day shortly after midnight (server time), e.g. from cron:
+
+    5 0 * * * cd /app && python birthday_digest.py
+"""
+import argparse
+import asyncio
+import time
+from datetime import date
+
+from src.database.db import database
+from src.repository import contacts as repository_contacts
+
+
+async def run(day: date) -> None:
+    started = time.perf_counter()
+    async with database.session() as db:
+        rows = await repository_contacts.build_birthday_digest(day, db)
+    await database.dispose()
+    print(f"birthday digest for {day}: {rows} contacts in {time.perf_counter() - started:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--date", type=date.fromisoformat, default=date.today(), help="day to compute, YYYY-MM-DD")
+    args = parser.parse_args()
+    asyncio.run(run(args.date))
+
+
+if __name__ == "__main__":
+    main()
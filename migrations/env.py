@@ -5,7 +5,7 @@ from sqlalchemy import pool
 
 from alembic import context
 from src.database.models import Base
-from src.database.db import SQLALCHEMY_DATABASE_URL
+from src.database.db import database_url
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -26,7 +26,7 @@ target_metadata = Base.metadata
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
 # ... etc.
-config.set_main_option("sqlalchemy.url", SQLALCHEMY_DATABASE_URL)
+config.set_main_option("sqlalchemy.url", database_url("psycopg2"))
 
 
 def run_migrations_offline() -> None:
@@ -0,0 +1,46 @@
+"""contacts bday_md
+
+Revision ID: 3f6a9c2d7b1e
+Revises: ec2b1f8beb8e
+Create Date: 2026-10-17 10:12:40.331208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6a9c2d7b1e'
+down_revision = 'ec2b1f8beb8e'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 10000
+BACKFILL = sa.text(
+    "UPDATE contacts "
+    "SET bday_md = CAST(EXTRACT(MONTH FROM date_of_birth) * 100 + EXTRACT(DAY FROM date_of_birth) AS SMALLINT) "
+    "WHERE id >= :low AND id < :high AND date_of_birth IS NOT NULL AND bday_md IS NULL"
+)
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('bday_md', sa.SmallInteger(), nullable=True))
+
+    if op.get_context().as_sql:
+        op.execute(BACKFILL.bindparams(low=0, high=2 ** 31 - 1))
+    else:
+        # Batches walk id ranges through the primary key instead of searching the table for unfilled rows,
+        # and each one commits on its own so its row locks are released right away
+        connection = op.get_bind()
+        low, high = connection.execute(sa.text("SELECT min(id), max(id) FROM contacts")).one()
+        with op.get_context().autocommit_block():
+            for start in range(low or 0, (high or -1) + 1, BACKFILL_BATCH_SIZE):
+                connection.execute(BACKFILL, {"low": start, "high": start + BACKFILL_BATCH_SIZE})
+
+    # Built once over the filled column instead of being updated by every batch
+    op.create_index('ix_contacts_user_id_bday_md', 'contacts', ['user_id', 'bday_md'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_bday_md', table_name='contacts')
+    op.drop_column('contacts', 'bday_md')
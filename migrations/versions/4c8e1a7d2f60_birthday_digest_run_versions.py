@@ -0,0 +1,38 @@
+"""birthday digest run versions
+
+Revision ID: 4c8e1a7d2f60
+Revises: b6d2f8e4c915
+Create Date: 2026-10-18 10:12:54.318406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c8e1a7d2f60'
+down_revision = 'b6d2f8e4c915'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Runs become per user and hold the data version the digest was computed from, the next
+    # birthday_digest.py run fills the table again
+    op.drop_table('birthday_digest_runs')
+    op.create_table('birthday_digest_runs',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('data_version', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('birthday_digest_runs')
+    op.create_table('birthday_digest_runs',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
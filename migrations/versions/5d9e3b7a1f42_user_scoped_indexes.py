@@ -0,0 +1,48 @@
+"""user scoped indexes
+
+Revision ID: 5d9e3b7a1f42
+Revises: c7e2a4f9d013
+Create Date: 2026-10-17 15:02:13.604718
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d9e3b7a1f42'
+down_revision = 'c7e2a4f9d013'
+branch_labels = None
+depends_on = None
+
+# Single column indexes no query uses: ids are covered by the primary keys, names by the user scoped
+# indexes, note is only searched by substring (trigram index) and date_of_birth was replaced by bday_md
+OBSOLETE_INDEXES = (
+    ('ix_persons_id', 'persons', ['id']),
+    ('ix_persons_first_name', 'persons', ['first_name']),
+    ('ix_persons_last_name', 'persons', ['last_name']),
+    ('ix_contacts_id', 'contacts', ['id']),
+    ('ix_contacts_note', 'contacts', ['note']),
+    ('ix_contacts_date_of_birth', 'contacts', ['date_of_birth']),
+)
+
+USER_SCOPED_INDEXES = (
+    ('ix_persons_user_id_id', 'persons', ['user_id', 'id']),
+    ('ix_persons_user_id_last_name_first_name', 'persons', ['user_id', 'last_name', 'first_name']),
+    ('ix_contacts_user_id_id', 'contacts', ['user_id', 'id']),
+    ('ix_contacts_person_id', 'contacts', ['person_id']),
+)
+
+
+def upgrade() -> None:
+    for name, table, columns in USER_SCOPED_INDEXES:
+        op.create_index(name, table, columns, unique=False)
+    for name, table, columns in OBSOLETE_INDEXES:
+        op.drop_index(name, table_name=table)
+
+
+def downgrade() -> None:
+    for name, table, columns in OBSOLETE_INDEXES:
+        op.create_index(name, table, columns, unique=False)
+    for name, table, columns in USER_SCOPED_INDEXES:
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,37 @@
+"""search trigram indexes
+
+Revision ID: 8b41d0e5a9c3
+Revises: 3f6a9c2d7b1e
+Create Date: 2026-10-17 11:03:18.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b41d0e5a9c3'
+down_revision = '3f6a9c2d7b1e'
+branch_labels = None
+depends_on = None
+
+TRGM_INDEXES = (
+    ('ix_persons_first_name_trgm', 'persons', 'first_name'),
+    ('ix_persons_last_name_trgm', 'persons', 'last_name'),
+    ('ix_contacts_email_trgm', 'contacts', 'email'),
+    ('ix_contacts_phone_trgm', 'contacts', 'phone'),
+    ('ix_contacts_note_trgm', 'contacts', 'note'),
+)
+
+
+def upgrade() -> None:
+    # pg_trgm lets GIN indexes serve ILIKE '%...%' used by contact search
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRGM_INDEXES:
+        op.create_index(name, table, [column], unique=False, postgresql_using='gin',
+                        postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(TRGM_INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,40 @@
+"""birthday digest
+
+Revision ID: 9a7f1c3e5b28
+Revises: e41c8f2b6a07
+Create Date: 2026-10-17 16:31:07.514293
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a7f1c3e5b28'
+down_revision = 'e41c8f2b6a07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('birthday_digest',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('position', sa.SmallInteger(), nullable=False),
+    sa.Column('contact_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['contact_id'], ['contacts.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'day', 'position', 'contact_id')
+    )
+    op.create_index(op.f('ix_birthday_digest_contact_id'), 'birthday_digest', ['contact_id'], unique=False)
+    op.create_table('birthday_digest_runs',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('birthday_digest_runs')
+    op.drop_index(op.f('ix_birthday_digest_contact_id'), table_name='birthday_digest')
+    op.drop_table('birthday_digest')
@@ -0,0 +1,28 @@
+"""users data version
+
+Revision ID: b6d2f8e4c915
+Revises: 9a7f1c3e5b28
+Create Date: 2026-10-17 23:58:41.207365
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d2f8e4c915'
+down_revision = '9a7f1c3e5b28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Constant defaults, so PostgreSQL adds both columns without rewriting the users table
+    op.add_column('users', sa.Column('data_version', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('data_changed_at', sa.DateTime(), server_default=sa.text('now()'),
+                                     nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'data_changed_at')
+    op.drop_column('users', 'data_version')
@@ -0,0 +1,34 @@
+"""per user unique constraints
+
+Revision ID: c7e2a4f9d013
+Revises: 8b41d0e5a9c3
+Create Date: 2026-10-17 14:26:51.117482
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e2a4f9d013'
+down_revision = '8b41d0e5a9c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Email and phone were unique across all users, now they are unique within one address book.
+    # Fails if a user already has duplicate persons or contacts, those have to be merged first.
+    op.drop_index('ix_contacts_email', table_name='contacts')
+    op.drop_index('ix_contacts_phone', table_name='contacts')
+    op.create_unique_constraint('uq_contacts_user_id_email', 'contacts', ['user_id', 'email'])
+    op.create_unique_constraint('uq_contacts_user_id_phone', 'contacts', ['user_id', 'phone'])
+    op.create_unique_constraint('uq_persons_user_id_name', 'persons', ['user_id', 'first_name', 'last_name'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_persons_user_id_name', 'persons', type_='unique')
+    op.drop_constraint('uq_contacts_user_id_phone', 'contacts', type_='unique')
+    op.drop_constraint('uq_contacts_user_id_email', 'contacts', type_='unique')
+    op.create_index('ix_contacts_phone', 'contacts', ['phone'], unique=True)
+    op.create_index('ix_contacts_email', 'contacts', ['email'], unique=True)
@@ -0,0 +1,160 @@
+"""
+Production launcher: preloads the app once, then forks worker processes that share one listening socket.
+
+Each worker gets fresh database pools after the fork and runs uvicorn with uvloop/httptools when installed.
+SIGTERM or SIGINT drains the workers: they stop accepting, finish in-flight requests (at most
+--graceful-timeout seconds) and run the shutdown events. A worker that dies on its own is replaced, but when
+workers keep failing at startup the server stops and exits with status 1.
+Every worker has its own pool of POOL_SIZE + MAX_OVERFLOW connections, keep workers * that below
+max_connections of the database.
+
+    python serve.py --host 0.0.0.0 --port 8000 --workers 4
+"""
+import argparse
+import importlib.util
+import logging
+import os
+import signal
+import sys
+import time
+
+import uvicorn
+
+logger = logging.getLogger("serve")
+
+# Exit status of a worker that did not finish starting, e.g. its lifespan startup failed
+WORKER_BOOT_ERROR = 3
+
+
+def pick(preferred: str, fallback: str) -> str:
+    return preferred if importlib.util.find_spec(preferred) else fallback
+
+
+def run_worker(config: uvicorn.Config, sock) -> int:
+    """Serves until shut down, returns the exit status of the worker."""
+    from src.database.db import database
+
+    # The parent's handlers must not run here, uvicorn installs its own graceful ones
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    database.reset_pools_after_fork()
+    server = uvicorn.Server(config)
+    try:
+        # A failed lifespan startup is logged by uvicorn and returns normally with started never set, later
+        # uvicorn versions exit with status 3 instead
+        server.run(sockets=[sock])
+    except SystemExit:
+        if server.started:
+            raise
+    return 0 if server.started else WORKER_BOOT_ERROR
+
+
+class Supervisor:
+    def __init__(self, config: uvicorn.Config, sock, workers: int, graceful_timeout: int, max_boot_errors: int = 5):
+        self.config = config
+        self.sock = sock
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.max_boot_errors = max_boot_errors
+        self.boot_errors = 0
+        self.children: set[int] = set()
+        self.stopping = False
+        self.failed = False
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                status = run_worker(self.config, self.sock)
+            except BaseException:
+                logger.exception("Worker %d crashed", os.getpid())
+            finally:
+                os._exit(status)
+        self.children.add(pid)
+        logger.info("Started worker %d", pid)
+
+    def stop(self, signum, frame) -> None:
+        self.stopping = True
+        for pid in self.children:
+            os.kill(pid, signal.SIGTERM)
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+        while self.children and not self.stopping:
+            pid, status = os.wait()
+            self.children.discard(pid)
+            if self.stopping:
+                break
+            status = os.waitstatus_to_exitcode(status)
+            # Only failures in a row count, a worker that started resets them
+            self.boot_errors = self.boot_errors + 1 if status == WORKER_BOOT_ERROR else 0
+            if self.boot_errors >= self.max_boot_errors:
+                logger.error("Workers failed to start %d times in a row, shutting down", self.boot_errors)
+                self.failed = True
+                self.stop(None, None)
+                break
+            logger.warning("Worker %d exited with status %d, restarting", pid, status)
+            # Keeps a worker that fails at startup from spinning
+            time.sleep(1)
+            self.spawn()
+        self.drain()
+
+    def drain(self) -> None:
+        # Workers finish in-flight requests within graceful_timeout, the extra seconds cover the shutdown events
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.children and time.monotonic() < deadline:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid:
+                self.children.discard(pid)
+            else:
+                time.sleep(0.1)
+        for pid in self.children:
+            logger.warning("Worker %d did not stop in time, killing it", pid)
+            os.kill(pid, signal.SIGKILL)
+        logger.info("All workers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="defaults to the CPU count")
+    parser.add_argument("--backlog", type=int, default=2048, help="pending connections the socket accepts")
+    parser.add_argument("--keep-alive", type=int, default=75,
+                        help="idle keep-alive seconds, keep it above the idle timeout of the load balancer")
+    parser.add_argument("--graceful-timeout", type=int, default=30)
+    parser.add_argument("--limit-concurrency", type=int, help="answer 503 above this many connections per worker")
+    parser.add_argument("--no-access-log", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    # Preloaded in the parent so each fork starts with the imports done, engines are created per worker
+    from main import app
+
+    config = uvicorn.Config(
+        app,
+        host=args.host,
+        port=args.port,
+        loop=pick("uvloop", "asyncio"),
+        http=pick("httptools", "h11"),
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        limit_concurrency=args.limit_concurrency,
+        access_log=not args.no_access_log,
+    )
+    sock = config.bind_socket()
+    logger.info("Listening on %s:%d with %d workers (%s, %s)", args.host, args.port, args.workers, config.loop,
+                config.http)
+    supervisor = Supervisor(config, sock, args.workers, args.graceful_timeout)
+    supervisor.run()
+    sock.close()
+    sys.exit(1 if supervisor.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
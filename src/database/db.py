@@ -1,29 +1,190 @@
 import configparser
+import itertools
+import os
 import pathlib
+import time
+from functools import cache, cached_property
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from fastapi import Depends, Request
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+
+from src.services.metrics import InstrumentedPool, instrument_engine
+from src.services.tokens import token_cache
 
 file_config = pathlib.Path(__file__).parent.parent.joinpath("conf/config.ini")
-config = configparser.ConfigParser()
-config.read(file_config)
 
-username = config.get("DEV", "USER")
-password = config.get("DEV", "PASSWORD")
-domain = config.get("DEV", "DOMAIN")
-port = config.get("DEV", "PORT")
-db_name = config.get("DEV", "DB_NAME")
+# Section of config.ini to use, every value can be overridden by a DB_<KEY> environment variable
+profile = os.environ.get("APP_PROFILE", "DEV")
+
+
+@cache
+def load_config() -> configparser.ConfigParser:
+    config = configparser.ConfigParser()
+    config.read(file_config)
+    return config
+
+
+def get_setting(key: str) -> str:
+    env_name = key if key.startswith("DB_") else f"DB_{key}"
+    return os.environ.get(env_name, load_config().get(profile, key))
+
+
+def get_bool_setting(key: str) -> bool:
+    return get_setting(key).strip().lower() in ("1", "true", "yes", "on")
+
+
+def database_url(driver: str = "asyncpg", host: str | None = None) -> str:
+    """
+    URL of the primary, or of the replica at host[:port]. The application works through asyncpg,
+    Alembic migrations through psycopg2.
+    """
+    host = host or get_setting("DOMAIN")
+    if ":" not in host:
+        host = f"{host}:{get_setting('PORT')}"
+    return f"postgresql+{driver}://{get_setting('USER')}:{get_setting('PASSWORD')}@{host}/{get_setting('DB_NAME')}"
+
+
+def make_engine(url: str, label: str):
+    engine = create_async_engine(
+        url,
+        echo=get_bool_setting("ECHO"),
+        poolclass=InstrumentedPool,
+        pool_size=int(get_setting("POOL_SIZE")),
+        max_overflow=int(get_setting("MAX_OVERFLOW")),
+        pool_timeout=float(get_setting("POOL_TIMEOUT")),
+        pool_recycle=int(get_setting("POOL_RECYCLE")),
+        pool_pre_ping=get_bool_setting("POOL_PRE_PING"),
+    )
+    instrument_engine(engine, label)
+    return engine
+
+
+class Database:
+    """
+    Engines and session factories of the primary and its replicas. Nothing is created on import: the config
+    is read and the driver loaded on first use, normally from the app's lifespan in each worker process.
+    """
+
+    @cached_property
+    def engine(self):
+        return make_engine(database_url(), "primary")
+
+    @cached_property
+    def session(self):
+        return async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False)
+
+    @cached_property
+    def replica_engines(self) -> list:
+        # Streaming replicas of the primary as comma separated host[:port], same credentials and database name
+        hosts = [host.strip() for host in get_setting("REPLICAS").split(",") if host.strip()]
+        return [make_engine(database_url(host=host), f"replica-{n}") for n, host in enumerate(hosts, start=1)]
+
+    @cached_property
+    def replica_sessions(self) -> list:
+        return [async_sessionmaker(replica, autoflush=False, expire_on_commit=False)
+                for replica in self.replica_engines]
 
-SQLALCHEMY_DATABASE_URL = f"postgresql+psycopg2://{username}:{password}@{domain}:{port}/{db_name}"
+    @cached_property
+    def sticky_seconds(self) -> float:
+        # After a write the client reads from the primary this long, so it sees its changes despite replica lag
+        return float(get_setting("REPLICA_STICKY_SECONDS"))
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, echo=True, max_overflow=5)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    def created_engines(self) -> list:
+        created = [self.__dict__["engine"]] if "engine" in self.__dict__ else []
+        return created + self.__dict__.get("replica_engines", [])
+
+    def reset_pools_after_fork(self) -> None:
+        """
+        Gives a forked worker its own empty pools for engines the parent already created. The parent's
+        connections are left open for the parent instead of being closed, sharing a socket corrupts both sides.
+        """
+        for engine in self.created_engines():
+            engine.sync_engine.dispose(close=False)
+
+    async def dispose(self) -> None:
+        for engine in self.created_engines():
+            await engine.dispose()
+
+
+database = Database()
+_next_replica = itertools.count()
+# After a write the client reads from the primary until the deadline sent back in the cookie, or in the header
+# for clients that keep no cookies
+STICKY_COOKIE = "db_primary_until"
+STICKY_HEADER = "X-DB-Primary-Until"
+# Deadlines of the users who wrote through this worker, for bearer clients that send neither back
+_sticky_users: dict[str, float] = {}
 
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with database.session() as db:
         yield db
-    finally:
-        db.close()
+
+
+def token_subject(request: Request) -> str | None:
+    """User of the request's bearer token, if this worker already verified the token."""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    payload = token_cache.peek(token) if scheme.lower() == "bearer" and token else None
+    return payload.get("sub") if payload else None
+
+
+def is_sticky(request: Request) -> bool:
+    now = time.time()
+    for deadline in (request.cookies.get(STICKY_COOKIE), request.headers.get(STICKY_HEADER)):
+        try:
+            if deadline and float(deadline) > now:
+                return True
+        except ValueError:
+            pass
+    subject = token_subject(request)
+    return subject is not None and _sticky_users.get(subject, 0) > now
+
+
+async def get_read_db(request: Request, primary: AsyncSession = Depends(get_db)):
+    """
+    Session for read-only routes: a replica in round robin, or the primary when there are no replicas
+    or the client wrote recently. The primary session does not hold a connection unless it is used.
+    """
+    replicas = database.replica_sessions
+    if not replicas or is_sticky(request):
+        yield primary
+        return
+    async with replicas[next(_next_replica) % len(replicas)]() as db:
+        yield db
+
+
+async def replica_stickiness_middleware(request: Request, call_next):
+    response = await call_next(request)
+    if database.replica_sessions and request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        sticky_seconds = database.sticky_seconds
+        now = time.time()
+        deadline = f"{now + sticky_seconds:.3f}"
+        response.set_cookie(STICKY_COOKIE, deadline, max_age=int(sticky_seconds) + 1, httponly=True, samesite="lax")
+        response.headers[STICKY_HEADER] = deadline
+        subject = token_subject(request)
+        if subject is not None:
+            if len(_sticky_users) >= 10000:
+                for expired in [user for user, until in _sticky_users.items() if until <= now]:
+                    del _sticky_users[expired]
+            _sticky_users[subject] = now + sticky_seconds
+    return response
+
+
+def dialect_insert(db: AsyncSession, model):
+    """INSERT construct of the session's dialect, for ON CONFLICT support (SQLite is used by the benchmarks)."""
+    dialect = sqlite if db.get_bind().dialect.name == "sqlite" else postgresql
+    return dialect.insert(model)
+
+
+def unique_violation(error: IntegrityError, table: str) -> bool:
+    """
+    Whether error comes from one of the uq_<table>_* unique constraints. asyncpg names the constraint,
+    SQLite only lists the columns of the table in its message.
+    """
+    constraint = getattr(error.orig.__cause__, "constraint_name", None)
+    if constraint is not None:
+        return constraint.startswith(f"uq_{table}_")
+    return str(error.orig).startswith(f"UNIQUE constraint failed: {table}.")
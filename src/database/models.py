@@ -1,15 +1,32 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, func
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, SmallInteger, String, Date, DateTime, Index, \
+    UniqueConstraint, func
+from sqlalchemy.orm import backref, relationship, declarative_base, validates
 
 Base = declarative_base()
 
 
+def month_day(value) -> int | None:
+    """MMDD number of a date, the value stored in Contact.bday_md."""
+    return value.month * 100 + value.day if value else None
+
+
 class Person(Base):
     __tablename__ = "persons"
+    __table_args__ = (
+        UniqueConstraint("user_id", "first_name", "last_name", name="uq_persons_user_id_name"),
+        # Every query is scoped to one user: keyset pages walk (user_id, id), lookups by last name use the
+        # second index and lookups by first name the unique constraint above
+        Index("ix_persons_user_id_id", "user_id", "id"),
+        Index("ix_persons_user_id_last_name_first_name", "user_id", "last_name", "first_name"),
+        Index("ix_persons_first_name_trgm", "first_name", postgresql_using="gin",
+              postgresql_ops={"first_name": "gin_trgm_ops"}),
+        Index("ix_persons_last_name_trgm", "last_name", postgresql_using="gin",
+              postgresql_ops={"last_name": "gin_trgm_ops"}),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    first_name = Column(String, index=True)
-    last_name = Column(String, index=True)
+    id = Column(Integer, primary_key=True)
+    first_name = Column(String)
+    last_name = Column(String)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
@@ -18,20 +35,57 @@ class Person(Base):
 
 class Contact(Base):
     __tablename__ = "contacts"
+    __table_args__ = (
+        UniqueConstraint("user_id", "email", name="uq_contacts_user_id_email"),
+        UniqueConstraint("user_id", "phone", name="uq_contacts_user_id_phone"),
+        Index("ix_contacts_user_id_id", "user_id", "id"),
+        # Contacts of a person, for the join in searches and ON DELETE CASCADE from persons
+        Index("ix_contacts_person_id", "person_id"),
+        Index("ix_contacts_user_id_bday_md", "user_id", "bday_md"),
+        Index("ix_contacts_email_trgm", "email", postgresql_using="gin", postgresql_ops={"email": "gin_trgm_ops"}),
+        Index("ix_contacts_phone_trgm", "phone", postgresql_using="gin", postgresql_ops={"phone": "gin_trgm_ops"}),
+        Index("ix_contacts_note_trgm", "note", postgresql_using="gin", postgresql_ops={"note": "gin_trgm_ops"}),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    date_of_birth = Column(DateTime, index=True)
-    email = Column(String, unique=True, index=True)
-    phone = Column(String, unique=True, index=True)
-    note = Column(String, index=True, nullable=True, default=None)
+    id = Column(Integer, primary_key=True)
+    date_of_birth = Column(DateTime)
+    # Birthday as MMDD number, derived from date_of_birth for calendar queries
+    bday_md = Column(SmallInteger, nullable=True)
+    email = Column(String)
+    phone = Column(String)
+    note = Column(String, nullable=True, default=None)
     blocked = Column(Boolean, nullable=True, default=False)
     person_id = Column(Integer, ForeignKey("persons.id", ondelete="CASCADE"))
-    person = relationship("Person", backref="contacts")
+    # Deleting a person deletes its contacts, through the ORM as through the ON DELETE CASCADE of a Core DELETE
+    person = relationship("Person", backref=backref("contacts", cascade="all, delete-orphan", passive_deletes=True))
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref="contacts")
 
+    @validates("date_of_birth")
+    def validate_date_of_birth(self, key, value):
+        self.bday_md = month_day(value)
+        return value
+
+
+class BirthdayDigest(Base):
+    """Contacts with a birthday in the window starting at day, precomputed by birthday_digest.py."""
+    __tablename__ = "birthday_digest"
+    user_id = Column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    # Order of the birthday within the window
+    position = Column(SmallInteger, primary_key=True)
+    contact_id = Column(ForeignKey("contacts.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+
+class BirthdayDigestRun(Base):
+    """Data version of each user the digest of day was computed from, the digest is stale once they differ."""
+    __tablename__ = "birthday_digest_runs"
+    user_id = Column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    data_version = Column(Integer, nullable=False)
+
 
 class User(Base):
     __tablename__ = "users"
@@ -41,3 +95,13 @@ class User(Base):
     password = Column(String(255), nullable=False)
     avatar = Column(String(255), nullable=True)
     refresh_token = Column(String(255), nullable=True)
+    # Bumped by every write to the user's contacts and persons, the validator of their list responses
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")
+    data_changed_at = Column(DateTime, nullable=False, default=func.now(), server_default=func.now())
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+    jti = Column(String(32), primary_key=True)
+    # Rows are only needed until the token would have expired anyway
+    expires_at = Column(DateTime, nullable=False, index=True)
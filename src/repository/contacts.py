@@ -1,114 +1,407 @@
-from datetime import datetime, timedelta
+import calendar
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Iterable
 
-from sqlalchemy.orm import Session
+from pydantic import ValidationError
+from sqlalchemy import select, insert, update as sql_update, delete as sql_delete, case, func, or_, union, literal, \
+    Date
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, joinedload, contains_eager
 
-from src.database.models import Person, Contact, User
-from src.repository.persons import get_person_by_first_name, get_person_by_last_name
-from src.schemas import ContactModel, ContactBlackList
+from src.database.db import dialect_insert
+from src.database.models import Person, Contact, User, BirthdayDigest, BirthdayDigestRun, month_day
+from src.schemas import ContactModel, ContactBlackList, ContactBatchUpdate, ContactBatchBlackList
 
+PERSON_LOADERS = {"selectin": selectinload, "joined": joinedload}
 
-async def get_contacts(user: User, limit: int, offset: int, db: Session):
-    contacts = db.query(Contact).filter_by(user_id=user.id).limit(limit).offset(offset).all()
-    return contacts
 
+def with_person(stmt, strategy: str = "selectin"):
+    """
+    Eager load Contact.person so serializing ContactResponse does not issue a query per row.
+    "selectin" costs one extra query per page, "joined" loads everything in a single query.
+    """
+    return stmt.options(PERSON_LOADERS[strategy](Contact.person))
 
-async def get_contact_by_id(user: User, contact_id: int, db: Session):
-    contact = db.query(Contact).filter_by(user_id=user.id, id=contact_id).first()
-    return contact
 
+# Response field -> labeled columns selected for it on the plain rows path
+CONTACT_ROW_COLUMNS = {
+    "id": (Contact.id.label("id"),),
+    "date_of_birth": (Contact.date_of_birth.label("date_of_birth"),),
+    "email": (Contact.email.label("email"),),
+    "phone": (Contact.phone.label("phone"),),
+    "note": (Contact.note.label("note"),),
+    "blocked": (Contact.blocked.label("blocked"),),
+    "person": (Person.id.label("person_id"), Person.first_name.label("person_first_name"),
+               Person.last_name.label("person_last_name")),
+}
 
-async def get_contact_by_email(user: User, email, db: Session):
-    contact = db.query(Contact).filter_by(user_id=user.id, email=email).first()
-    return contact
 
+def contact_row(row) -> dict:
+    """ContactResponse-shaped dict built from trusted column values without model validation."""
+    item = row._asdict()
+    date_of_birth = item.get("date_of_birth")
+    if isinstance(date_of_birth, datetime):
+        item["date_of_birth"] = date_of_birth.date()
+    if "person_id" in item:
+        item["person"] = {"id": item.pop("person_id"), "first_name": item.pop("person_first_name"),
+                          "last_name": item.pop("person_last_name")}
+    return item
+
+
+async def fetch_contacts(stmt, db: AsyncSession, load: str = "selectin", joined: bool = False,
+                         fields: Iterable[str] | None = None):
+    """
+    Runs a select(Contact) statement. load="rows" selects only the response columns and returns plain dicts
+    for the fast serialization path, any other value is an eager loading strategy for the ORM objects.
+    On the rows path fields limits the selected columns and keys (id is always included).
+    joined tells that the statement already joins Contact.person.
+    """
+    if load == "rows":
+        fields = {"id", *fields} if fields else CONTACT_ROW_COLUMNS.keys()
+        if "person" in fields and not joined:
+            stmt = stmt.join(Contact.person)
+        columns = [column for field in CONTACT_ROW_COLUMNS if field in fields for column in CONTACT_ROW_COLUMNS[field]]
+        result = await db.execute(stmt.with_only_columns(*columns))
+        return [contact_row(row) for row in result]
+    stmt = stmt.options(contains_eager(Contact.person)) if joined else with_person(stmt, load)
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+
+async def get_data_state(user: User, db: AsyncSession):
+    """
+    Version and last change of the user's contacts and persons, changing whenever any of their list responses
+    would. A primary key lookup, the writes keep it current through touch_data.
+    """
+    state = await db.execute(select(User.data_version, User.data_changed_at).filter(User.id == user.id))
+    return tuple(state.one())
+
+
+async def touch_data(user: User, db: AsyncSession) -> None:
+    """
+    Bumps the version of the user's contacts and persons, in the transaction of the write and before its
+    statements: concurrent writes of one user then queue on the users row instead of locking rows in
+    different orders. A write that turns out to change nothing rolls back, taking the bump with it.
+    """
+    stmt = sql_update(User).filter(User.id == user.id) \
+        .values(data_version=User.data_version + 1, data_changed_at=func.now()) \
+        .execution_options(synchronize_session=False)
+    await db.execute(stmt)
+
+
+async def get_contacts(user: User, limit: int, offset: int, db: AsyncSession, load: str = "selectin",
+                       after: int | None = None, fields: Iterable[str] | None = None):
+    stmt = select(Contact).filter_by(user_id=user.id)
+    if after is not None:
+        # Keyset pagination: continue right after the last seen id instead of skipping rows
+        stmt = stmt.filter(Contact.id > after)
+        offset = 0
+    stmt = stmt.order_by(Contact.id).limit(limit).offset(offset)
+    return await fetch_contacts(stmt, db, load, fields=fields)
+
+
+async def get_contact_by_id(user: User, contact_id: int, db: AsyncSession, load: str = "joined"):
+    stmt = with_person(select(Contact).filter_by(user_id=user.id, id=contact_id), load)
+    contact = await db.execute(stmt)
+    return contact.scalars().first()
 
-async def get_contact_by_phone(user: User, phone, db: Session):
-    contact = db.query(Contact).filter_by(user_id=user.id, phone=phone).first()
-    return contact
 
+async def get_contact_by_email(user: User, email, db: AsyncSession):
+    stmt = select(Contact).filter_by(user_id=user.id, email=email)
+    contact = await db.execute(stmt)
+    return contact.scalars().first()
 
-async def create(user: User, body: ContactModel, db: Session):
-    contact = Contact(**body.dict(), user_id=user.id)
-    db.add(contact)
-    db.commit()
+
+async def get_contact_by_phone(user: User, phone, db: AsyncSession):
+    stmt = select(Contact).filter_by(user_id=user.id, phone=phone)
+    contact = await db.execute(stmt)
+    return contact.scalars().first()
+
+
+async def create(user: User, body: ContactModel, db: AsyncSession):
+    """
+    Single INSERT ... ON CONFLICT DO NOTHING relying on the per-user unique email/phone constraints,
+    returns None when the contact already exists.
+    """
+    values = {**body.dict(), "user_id": user.id, "bday_md": month_day(body.date_of_birth)}
+    await touch_data(user, db)
+    stmt = dialect_insert(db, Contact).values(values).on_conflict_do_nothing().returning(Contact)
+    contact = await db.execute(stmt)
+    contact = contact.scalars().first()
+    await (db.commit() if contact else db.rollback())
+    if contact:
+        await db.refresh(contact, ["person"])
     return contact
 
 
-async def update(user: User, contact_id: int, body: ContactModel, db: Session):
+async def import_contacts(user: User, rows: Iterable[tuple[int, dict | None]], db: AsyncSession,
+                          chunk_size: int = 1000):
+    imported, errors = 0, []
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        valid = {}
+        for number, raw in chunk:
+            if raw is None:
+                errors.append({"row": number, "detail": "Malformed row"})
+                continue
+            try:
+                valid[number] = ContactModel(**raw)
+            except ValidationError as e:
+                detail = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+                errors.append({"row": number, "detail": detail})
+        if not valid:
+            continue
+
+        # One query per chunk for already taken emails/phones and for the user's persons
+        emails = {body.email for body in valid.values()}
+        phones = {body.phone for body in valid.values()}
+        existing = await db.execute(select(Contact.email, Contact.phone).filter(
+            Contact.user_id == user.id, or_(Contact.email.in_(emails), Contact.phone.in_(phones))))
+        taken = set()
+        for email, phone in existing:
+            taken.update((email, phone))
+        person_ids = {body.person_id for body in valid.values()}
+        persons = await db.execute(select(Person.id).filter(Person.user_id == user.id, Person.id.in_(person_ids)))
+        own_persons = set(persons.scalars())
+
+        values, numbers_by_email = [], {}
+        for number, body in valid.items():
+            if body.email in taken or body.phone in taken:
+                errors.append({"row": number, "detail": "Contact is exists"})
+                continue
+            if body.person_id not in own_persons:
+                errors.append({"row": number, "detail": "Person not found"})
+                continue
+            taken.update((body.email, body.phone))
+            numbers_by_email[body.email] = number
+            values.append({**body.dict(), "user_id": user.id, "bday_md": month_day(body.date_of_birth)})
+        if not values:
+            continue
+
+        await touch_data(user, db)
+        stmt = dialect_insert(db, Contact).values(values).on_conflict_do_nothing().returning(Contact.email)
+        inserted = set((await db.execute(stmt)).scalars())
+        await (db.commit() if inserted else db.rollback())
+        imported += len(inserted)
+        # Rows skipped by ON CONFLICT collide with contacts created concurrently
+        for email, number in numbers_by_email.items():
+            if email not in inserted:
+                errors.append({"row": number, "detail": "Contact is exists"})
+    errors.sort(key=lambda error: error["row"])
+    return {"imported": imported, "errors": errors}
+
+
+EXPORT_FIELDS = ("id", "date_of_birth", "email", "phone", "note", "blocked", "person_id", "first_name", "last_name")
+
+
+async def stream_contacts(user: User, db: AsyncSession, partition_size: int = 1000):
+    """Plain row tuples read through a server-side cursor, without building ORM objects."""
+    stmt = select(Contact.id, Contact.date_of_birth, Contact.email, Contact.phone, Contact.note, Contact.blocked,
+                  Contact.person_id, Person.first_name, Person.last_name) \
+        .outerjoin(Contact.person).filter(Contact.user_id == user.id).order_by(Contact.id) \
+        .execution_options(yield_per=partition_size)
+    result = await db.stream(stmt)
+    async for partition in result.partitions():
+        yield partition
+
+
+async def update(user: User, contact_id: int, body: ContactModel, db: AsyncSession):
     contact = await get_contact_by_id(user, contact_id, db)
     if contact:
+        await touch_data(user, db)
         contact.date_of_birth = body.date_of_birth
         contact.email = body.email
         contact.phone = body.phone
         contact.note = body.note
         contact.blocked = body.blocked
         contact.person_id = body.person_id
-        db.commit()
+        await db.commit()
+        await db.refresh(contact, ["person"])
     return contact
 
 
-async def remove(user: User, contact_id: int, db: Session):
-    contact = await get_contact_by_id(user.id, contact_id, db)
+async def remove(user: User, contact_id: int, db: AsyncSession):
+    contact = await get_contact_by_id(user, contact_id, db)
     if contact:
-        db.delete(contact)
-        db.commit()
+        await touch_data(user, db)
+        await db.delete(contact)
+        await db.commit()
     return contact
 
 
-async def block(user: User, contact_id: int, body: ContactBlackList, db: Session):
-    contact = await get_contact_by_id(user.id, contact_id, db)
+async def block(user: User, contact_id: int, body: ContactBlackList, db: AsyncSession):
+    contact = await get_contact_by_id(user, contact_id, db)
     if contact:
+        await touch_data(user, db)
         contact.blocked = body.blocked
-        db.commit()
+        await db.commit()
     return contact
 
 
-async def get_contact_by_person(user: User, person: Person, db: Session):
-    contact = db.query(Contact).filter_by(user_id=user.id, person=person).all()
-    return contact
+SEARCH_PERSON_COLUMNS = (Person.first_name, Person.last_name)
+SEARCH_CONTACT_COLUMNS = (Contact.email, Contact.phone, Contact.note)
 
 
-async def get_contacts_by_email(user: User, email, db: Session):
-    contact = db.query(Contact).filter_by(user_id=user.id, email=email).all()
-    return contact
+def like_pattern(data: str, escape: str = "/") -> str:
+    """LIKE pattern matching data anywhere, with the wildcards in data escaped."""
+    for char in (escape, "%", "_"):
+        data = data.replace(char, escape + char)
+    return f"%{data}%"
+
+
+async def search_contacts(user: User, data: str, limit: int, offset: int, db: AsyncSession, load: str = "joined",
+                          fields: Iterable[str] | None = None):
+    """
+    Contacts whose person's name, email, phone or note contains data. Matching ids are collected per table
+    with plain ILIKE (not lower() LIKE), so on PostgreSQL every arm is answered by the trigram indexes of its
+    own table, only the matches are joined and ranked.
+    """
+    pattern = like_pattern(data)
+    person_ids = select(Person.id).filter(
+        Person.user_id == user.id, or_(*(column.ilike(pattern, escape="/") for column in SEARCH_PERSON_COLUMNS)))
+    contact_ids = union(
+        select(Contact.id).filter(Contact.user_id == user.id, Contact.person_id.in_(person_ids)),
+        select(Contact.id).filter(
+            Contact.user_id == user.id, or_(*(column.ilike(pattern, escape="/") for column in SEARCH_CONTACT_COLUMNS))),
+    )
+    columns = SEARCH_PERSON_COLUMNS + SEARCH_CONTACT_COLUMNS
+    # Exact matches first, then prefix matches, then substring matches
+    rank = case(
+        (or_(*(func.lower(column) == data.lower() for column in columns)), 0),
+        (or_(*(column.istartswith(data, autoescape=True) for column in columns)), 1),
+        else_=2,
+    )
+    stmt = select(Contact).join(Contact.person).filter(Contact.user_id == user.id, Contact.id.in_(contact_ids)) \
+        .order_by(rank, Contact.id).limit(limit).offset(offset)
+    return await fetch_contacts(stmt, db, load, joined=True, fields=fields)
+
+
+def birthday_window(start: date, days: int = 7) -> list[int]:
+    """Month-day numbers (MMDD) of every day from start up to start + days inclusive."""
+    window = []
+    for shift in range(days + 1):
+        day = start + timedelta(days=shift)
+        # Feb 29 birthdays are celebrated on Mar 1 in non-leap years
+        if day.month == 3 and day.day == 1 and not calendar.isleap(day.year):
+            window.append(229)
+        window.append(day.month * 100 + day.day)
+    return window
+
+
+async def get_contacts_hb(user: User, limit: int, offset: int, db: AsyncSession, days: int = 7,
+                          load: str = "selectin", fields: Iterable[str] | None = None):
+    window = birthday_window(datetime.now().date(), days)
+    # Order by position in the window so birthdays after the year wrap go last
+    position = case({md: i for i, md in enumerate(window)}, value=Contact.bday_md)
+    stmt = select(Contact).filter(Contact.user_id == user.id, Contact.bday_md.in_(window))
+    stmt = stmt.order_by(position, Contact.id).limit(limit).offset(offset)
+    return await fetch_contacts(stmt, db, load, fields=fields)
+
+
+async def build_birthday_digest(day: date, db: AsyncSession, days: int = 7) -> int:
+    """
+    Recomputes the digest of day for all users with one INSERT ... SELECT and drops the digests of
+    earlier days. Returns the number of digest rows.
+    """
+    window = birthday_window(day, days)
+    position = case({md: i for i, md in enumerate(window)}, value=Contact.bday_md)
+    await db.execute(sql_delete(BirthdayDigestRun).filter(BirthdayDigestRun.day <= day))
+    await db.execute(sql_delete(BirthdayDigest).filter(BirthdayDigest.day <= day))
+    # Versions are read before the contacts: a write committed in between is newer than the recorded version,
+    # so it makes the digest of its user stale instead of hiding behind it
+    versions = select(User.id, literal(day, Date), User.data_version)
+    await db.execute(insert(BirthdayDigestRun).from_select(["user_id", "day", "data_version"], versions))
+    rows = select(Contact.user_id, literal(day, Date), position, Contact.id).filter(Contact.bday_md.in_(window))
+    result = await db.execute(insert(BirthdayDigest).from_select(["user_id", "day", "position", "contact_id"], rows))
+    await db.commit()
+    return result.rowcount
+
+
+async def get_birthday_state(user: User, day: date, db: AsyncSession) -> tuple[int, datetime, int | None]:
+    """get_data_state of the user, plus the data version their digest of day was computed from if there is one."""
+    stmt = select(User.data_version, User.data_changed_at, BirthdayDigestRun.data_version) \
+        .outerjoin(BirthdayDigestRun, (BirthdayDigestRun.user_id == User.id) & (BirthdayDigestRun.day == day)) \
+        .filter(User.id == user.id)
+    return tuple((await db.execute(stmt)).one())
+
+
+async def get_contacts_digest(user: User, day: date, limit: int, offset: int, db: AsyncSession,
+                              load: str = "selectin", fields: Iterable[str] | None = None):
+    """Same result as get_contacts_hb, read by primary key from the digest of day."""
+    stmt = select(Contact).join(BirthdayDigest, BirthdayDigest.contact_id == Contact.id) \
+        .filter(BirthdayDigest.user_id == user.id, BirthdayDigest.day == day) \
+        .order_by(BirthdayDigest.position, BirthdayDigest.contact_id).limit(limit).offset(offset)
+    return await fetch_contacts(stmt, db, load, fields=fields)
+
+
+def batch_outcomes(ids: Iterable[int], done: set[int], status: str, failed: dict[int, str] | None = None) -> dict:
+    """
+    Per-id result in request order. Ids in failed get their failure status, other ids that did not match
+    a contact of the user are reported as not_found.
+    """
+    failed = failed or {}
+    return {"results": [{"id": i, "status": failed.get(i) or (status if i in done else "not_found")}
+                        for i in dict.fromkeys(ids)]}
+
+
+async def update_many(user: User, bodies: list[ContactBatchUpdate], db: AsyncSession):
+    """
+    Updates the user's contacts in one executemany. Bodies pointing to a person of another user are
+    reported as person_not_found, bodies taking an email or phone of another contact (or of an earlier body
+    of the batch) as conflict, both are skipped instead of failing the whole batch.
+    """
+    ids = [body.id for body in bodies]
+    owned = await db.execute(select(Contact.id).filter(Contact.user_id == user.id, Contact.id.in_(ids)))
+    owned = set(owned.scalars())
+    bodies = [body for body in bodies if body.id in owned]
+
+    # One query for the user's persons and one for the contacts holding the requested emails/phones
+    person_ids = {body.person_id for body in bodies}
+    persons = await db.execute(select(Person.id).filter(Person.user_id == user.id, Person.id.in_(person_ids)))
+    own_persons = set(persons.scalars())
+    emails = {body.email for body in bodies}
+    phones = {body.phone for body in bodies}
+    existing = await db.execute(select(Contact.id, Contact.email, Contact.phone).filter(
+        Contact.user_id == user.id, or_(Contact.email.in_(emails), Contact.phone.in_(phones))))
+    holders = {}
+    for contact_id, email, phone in existing:
+        holders[("email", email)] = contact_id
+        holders[("phone", phone)] = contact_id
+
+    values, failed = [], {}
+    for body in bodies:
+        keys = (("email", body.email), ("phone", body.phone))
+        if body.person_id not in own_persons:
+            failed[body.id] = "person_not_found"
+        elif any(holders.get(key, body.id) != body.id for key in keys):
+            failed[body.id] = "conflict"
+        else:
+            holders.update(dict.fromkeys(keys, body.id))
+            values.append({**body.dict(), "bday_md": month_day(body.date_of_birth)})
+    if values:
+        await touch_data(user, db)
+        # ORM bulk UPDATE by primary key, a single executemany
+        await db.execute(sql_update(Contact), values)
+    await db.commit()
+    return batch_outcomes(ids, owned, "updated", failed)
+
+
+async def block_many(user: User, body: ContactBatchBlackList, db: AsyncSession):
+    await touch_data(user, db)
+    stmt = sql_update(Contact).filter(Contact.user_id == user.id, Contact.id.in_(body.ids)) \
+        .values(blocked=body.blocked).returning(Contact.id).execution_options(synchronize_session=False)
+    updated = await db.execute(stmt)
+    updated = set(updated.scalars())
+    await (db.commit() if updated else db.rollback())
+    return batch_outcomes(body.ids, updated, "updated")
 
 
-async def search_contacts(user: User, data: str, db: Session):
-    persons_fn = await get_person_by_first_name(user.id, data, db)
-    persons_ln = await get_person_by_last_name(user.id, data, db)
-    print(persons_fn, persons_ln)
-    persons = persons_fn + persons_ln
-    if persons:
-        contacts = []
-        for person in persons:
-            contact = await get_contact_by_person(user.id, person, db)
-            contacts.append(contact[0])
-    else:
-        contacts = await get_contacts_by_email(user.id, data, db)
-    if contacts:
-        print(contacts)
-        return contacts
-
-
-async def get_contacts_hb_id_list(user: User, db: Session):
-    end_day = datetime.now() + timedelta(days=7)
-    current_day = datetime.now().date()
-    current_year = datetime.now().strftime("%Y")
-    end_day = end_day.date()
-    contacts = db.query(Contact).filter_by(user_id=user.id).all()
-    contacts_id_list = []
-    for contact in contacts:
-        contact_bd_str = contact.date_of_birth.strftime("%Y-%m-%d")
-        contact_bd_new = contact_bd_str.replace(contact.date_of_birth.strftime("%Y"), current_year)
-        contact_bd_new_dt = datetime.strptime(contact_bd_new, '%Y-%m-%d').date()
-        if current_day <= contact_bd_new_dt <= end_day:
-            contacts_id_list.append(contact.id)
-    return contacts_id_list
-
-
-async def get_contacts_hb(user: User, contacts_id_list, limit, offset, db: Session):
-    contacts = []
-    for contact_id in contacts_id_list:
-        contact = db.query(Contact).filter_by(user_id=user.id, id=contact_id).limit(limit).offset(offset).all()
-        contacts.append(contact[0])
-    return contacts
+async def remove_many(user: User, ids: list[int], db: AsyncSession):
+    await touch_data(user, db)
+    stmt = sql_delete(Contact).filter(Contact.user_id == user.id, Contact.id.in_(ids)) \
+        .returning(Contact.id).execution_options(synchronize_session=False)
+    removed = await db.execute(stmt)
+    removed = set(removed.scalars())
+    await (db.commit() if removed else db.rollback())
+    return batch_outcomes(ids, removed, "deleted")
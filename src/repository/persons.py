@@ -1,53 +1,138 @@
-from sqlalchemy.orm import Session
+from typing import Iterable
 
+from sqlalchemy import select, update as sql_update, delete as sql_delete, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.db import dialect_insert
 from src.database.models import Person, User
-from src.schemas import PersonModel
+from src.repository.contacts import batch_outcomes, get_data_state, touch_data
+from src.schemas import PersonModel, PersonBatchUpdate
 
 
-async def get_persons(db: Session, user: User):
-    persons = db.query(Person).filter_by(user_id=user.id).all()
-    return persons
+async def get_persons_state(db: AsyncSession, user: User):
+    """Validator of the persons lists, the data version of the user covers persons as well as contacts."""
+    return await get_data_state(user, db)
 
 
-async def get_person_by_id(person_id: int, db: Session, user: User):
-    person = db.query(Person).filter_by(id=person_id, user_id=user.id).first()
-    return person
+PERSON_ROW_COLUMNS = {"id": Person.id, "first_name": Person.first_name, "last_name": Person.last_name}
 
 
-async def get_person_by_name(first_name, last_name, db: Session, user: User):
-    person = db.query(Person).filter_by(first_name=first_name, last_name=last_name, user_id=user.id).first()
-    return person
+async def get_persons(db: AsyncSession, user: User, limit: int, after: int | None = None, load: str = "orm",
+                      fields: Iterable[str] | None = None):
+    """
+    load="rows" returns plain PersonResponse-shaped dicts instead of ORM objects,
+    limited to the given fields (id is always included).
+    """
+    stmt = select(Person).filter_by(user_id=user.id)
+    if after is not None:
+        stmt = stmt.filter(Person.id > after)
+    stmt = stmt.order_by(Person.id).limit(limit)
+    if load == "rows":
+        fields = {"id", *fields} if fields else PERSON_ROW_COLUMNS.keys()
+        columns = [column for field, column in PERSON_ROW_COLUMNS.items() if field in fields]
+        persons = await db.execute(stmt.with_only_columns(*columns))
+        return [row._asdict() for row in persons]
+    persons = await db.execute(stmt)
+    return persons.scalars().all()
+
+
+EXPORT_FIELDS = ("id", "first_name", "last_name")
+
+
+async def stream_persons(db: AsyncSession, user: User, partition_size: int = 1000):
+    """Plain row tuples read through a server-side cursor, without building ORM objects."""
+    stmt = select(Person.id, Person.first_name, Person.last_name).filter_by(user_id=user.id) \
+        .order_by(Person.id).execution_options(yield_per=partition_size)
+    result = await db.stream(stmt)
+    async for partition in result.partitions():
+        yield partition
+
 
+async def get_person_by_id(person_id: int, db: AsyncSession, user: User):
+    person = await db.execute(select(Person).filter_by(id=person_id, user_id=user.id))
+    return person.scalars().first()
 
-async def create(body: PersonModel, db: Session, user: User):
-    person = Person(**body.dict(), user_id=user.id)
-    db.add(person)
-    db.commit()
+
+async def get_person_by_name(first_name, last_name, db: AsyncSession, user: User):
+    stmt = select(Person).filter_by(first_name=first_name, last_name=last_name, user_id=user.id)
+    person = await db.execute(stmt)
+    return person.scalars().first()
+
+
+async def create(body: PersonModel, db: AsyncSession, user: User):
+    """Single INSERT ... ON CONFLICT DO NOTHING, returns None when the user already has a person with this name."""
+    await touch_data(user, db)
+    stmt = dialect_insert(db, Person).values(**body.dict(), user_id=user.id).on_conflict_do_nothing().returning(Person)
+    person = await db.execute(stmt)
+    person = person.scalars().first()
+    await (db.commit() if person else db.rollback())
     return person
 
 
-async def update(person_id: int, body: PersonModel, db: Session, user: User):
-    person = await get_person_by_id(person_id, db, user.id)
+async def update(person_id: int, body: PersonModel, db: AsyncSession, user: User):
+    person = await get_person_by_id(person_id, db, user)
     if person:
+        await touch_data(user, db)
         person.first_name = body.first_name
         person.last_name = body.last_name
-        db.commit()
+        await db.commit()
     return person
 
 
-async def remove(person_id: int, db: Session, user: User):
-    person = await get_person_by_id(person_id, db, user.id)
+async def remove(person_id: int, db: AsyncSession, user: User):
+    person = await get_person_by_id(person_id, db, user)
     if person:
-        db.delete(person)
-        db.commit()
+        await touch_data(user, db)
+        await db.delete(person)
+        await db.commit()
     return person
 
 
-async def get_person_by_first_name(first_name, db: Session, user: User):
-    person = db.query(Person).filter_by(first_name=first_name, user_id=user.id).all()
-    return person
-
-
-async def get_person_by_last_name(last_name, db: Session, user: User):
-    person = db.query(Person).filter_by(last_name=last_name, user_id=user.id).all()
-    return person
+async def get_person_by_first_name(first_name, db: AsyncSession, user: User):
+    person = await db.execute(select(Person).filter_by(first_name=first_name, user_id=user.id))
+    return person.scalars().all()
+
+
+async def get_person_by_last_name(last_name, db: AsyncSession, user: User):
+    person = await db.execute(select(Person).filter_by(last_name=last_name, user_id=user.id))
+    return person.scalars().all()
+
+
+async def update_many(bodies: list[PersonBatchUpdate], db: AsyncSession, user: User):
+    """
+    Updates the user's persons in one executemany. Bodies taking the name of another person (or of an earlier
+    body of the batch) are reported as conflict and skipped instead of failing the whole batch.
+    """
+    ids = [body.id for body in bodies]
+    owned = await db.execute(select(Person.id).filter(Person.user_id == user.id, Person.id.in_(ids)))
+    owned = set(owned.scalars())
+    bodies = [body for body in bodies if body.id in owned]
+
+    names = {(body.first_name, body.last_name) for body in bodies}
+    existing = await db.execute(select(Person.id, Person.first_name, Person.last_name).filter(
+        Person.user_id == user.id, tuple_(Person.first_name, Person.last_name).in_(names)))
+    holders = {(first_name, last_name): person_id for person_id, first_name, last_name in existing}
+
+    values, failed = [], {}
+    for body in bodies:
+        name = (body.first_name, body.last_name)
+        if holders.setdefault(name, body.id) != body.id:
+            failed[body.id] = "conflict"
+        else:
+            values.append(body.dict())
+    if values:
+        await touch_data(user, db)
+        # ORM bulk UPDATE by primary key, a single executemany
+        await db.execute(sql_update(Person), values)
+    await db.commit()
+    return batch_outcomes(ids, owned, "updated", failed)
+
+
+async def remove_many(ids: list[int], db: AsyncSession, user: User):
+    await touch_data(user, db)
+    stmt = sql_delete(Person).filter(Person.user_id == user.id, Person.id.in_(ids)) \
+        .returning(Person.id).execution_options(synchronize_session=False)
+    removed = await db.execute(stmt)
+    removed = set(removed.scalars())
+    await (db.commit() if removed else db.rollback())
+    return batch_outcomes(ids, removed, "deleted")
@@ -1,30 +1,49 @@
-import logging
-from libgravatar import Gravatar
-from sqlalchemy.orm import Session
+from datetime import datetime
 
-from src.database.models import User
+from sqlalchemy import select, update as sql_update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User, RevokedToken
 from src.schemas import UserModel
+from src.services.cache import user_cache
+from src.services.jobs import job_queue
 
 
-async def get_user_by_email(email: str, db: Session) -> User | None:
-    return db.query(User).filter(User.email == email).first()
+async def get_user_by_email(email: str, db: AsyncSession) -> User | None:
+    user = await db.execute(select(User).filter(User.email == email))
+    return user.scalars().first()
 
 
-async def create_user(body: UserModel, db: Session) -> User:
-    avatar = None
-    try:
-        g = Gravatar(body.email)
-        avatar = g.get_image()
-    except Exception as e:
-        logging.error(e)
-    new_user = User(**body.dict(), avatar=avatar)
+async def create_user(body: UserModel, db: AsyncSession) -> User:
+    # The avatar is filled in by the resolve_avatar job after signup
+    new_user = User(**body.dict())
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 
-async def update_token(user: User, token: str | None, db: Session) -> None:
+@job_queue.task
+async def resolve_avatar(db: AsyncSession, user_id: int, email: str) -> None:
+    from libgravatar import Gravatar
+
+    avatar = Gravatar(email).get_image()
+    await db.execute(sql_update(User).filter_by(id=user_id).values(avatar=avatar))
+    await db.commit()
+    await user_cache.invalidate(email)
+
+
+async def update_token(user: User, token: str | None, db: AsyncSession) -> None:
     user.refresh_token = token
-    db.commit()
-    
\ No newline at end of file
+    await db.commit()
+    await user_cache.invalidate(user.email)
+
+
+async def revoke_token(jti: str, expires_at: datetime, db: AsyncSession) -> None:
+    db.add(RevokedToken(jti=jti, expires_at=expires_at))
+    await db.commit()
+
+
+async def get_revoked_tokens(db: AsyncSession, now: datetime) -> list[tuple[str, datetime]]:
+    rows = await db.execute(select(RevokedToken.jti, RevokedToken.expires_at).filter(RevokedToken.expires_at > now))
+    return rows.all()
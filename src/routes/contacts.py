@@ -1,48 +1,134 @@
+from datetime import date
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, Path, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Path, status, Query, UploadFile, Request, Response
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from pydantic import conlist
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db, unique_violation
 from src.database.models import User
 from src.repository import contacts as repository_contacts
-from src.schemas import ContactModel, ContactResponse, ContactBlackList
+from src.repository import persons as repository_persons
+from src.schemas import ContactModel, ContactResponse, ContactBlackList, ContactImportResponse, ContactBatchUpdate, \
+    ContactBatchBlackList, BatchIds, BatchResponse
 from src.services.auth import auth_service
+from src.services.contacts_io import read_rows, write_rows, gzip_stream, MEDIA_TYPES
+from src.services.etag import make_etag, etag_matches, set_cache_headers, not_modified
+from src.services.fields import parse_fields
+from src.services.pagination import decode_cursor, set_next_cursor
 
 router = APIRouter(prefix="/contacts", tags=["contacts"])
 
 
 @router.get("/", response_model=List[ContactResponse])
-async def get_contacts(current_user: User = Depends(auth_service.get_current_user), limit: int = Query(10, le=300),
-                       offset: int = 0, db: Session = Depends(get_db)):
-    contacts = await repository_contacts.get_contacts(current_user, limit, offset, db)
-    return contacts
+async def get_contacts(request: Request, current_user: User = Depends(auth_service.get_current_user),
+                       limit: int = Query(10, le=300), offset: int = 0, after: str | None = None,
+                       fields: str | None = None, db: AsyncSession = Depends(get_read_db)):
+    selected = parse_fields(fields, repository_contacts.CONTACT_ROW_COLUMNS)
+    state = await repository_contacts.get_data_state(current_user, db)
+    etag = make_etag(*state, limit, offset, after, selected)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    # Plain rows go straight to orjson, skipping ContactResponse validation of every item
+    contacts = await repository_contacts.get_contacts(current_user, limit, offset, db, load="rows",
+                                                      after=decode_cursor(after), fields=selected)
+    response = ORJSONResponse(contacts)
+    set_next_cursor(response, contacts, limit)
+    set_cache_headers(response, etag)
+    return response
+
+
+@router.get("/export")
+async def export_contacts(fmt: str = Query("csv", alias="format", regex="^(csv|ndjson)$"), gzip: bool = False,
+                        db: AsyncSession = Depends(get_read_db),
+                        current_user: User = Depends(auth_service.get_current_user)):
+    chunks = write_rows(repository_contacts.stream_contacts(current_user, db), repository_contacts.EXPORT_FIELDS, fmt)
+    headers = {"Content-Disposition": f'attachment; filename="contacts.{fmt}"'}
+    if gzip:
+        chunks = gzip_stream(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[fmt], headers=headers)
 
 
 @router.get("/{contact_id}", response_model=ContactResponse)
-async def get_contact(current_user: User = Depends(auth_service.get_current_user), contact_id: int = Path(ge=1),
-                      db: Session = Depends(get_db)):
+async def get_contact(request: Request, response: Response,
+                      current_user: User = Depends(auth_service.get_current_user), contact_id: int = Path(ge=1),
+                      db: AsyncSession = Depends(get_read_db)):
     contact = await repository_contacts.get_contact_by_id(current_user, contact_id, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    etag = make_etag(contact.id, contact.updated_at, contact.person.updated_at if contact.person else None)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_cache_headers(response, etag)
     return contact
 
 
 @router.post("/", response_model=ContactResponse, status_code=status.HTTP_201_CREATED)
-async def create_contact(body: ContactModel, db: Session = Depends(get_db),
+async def create_contact(body: ContactModel, db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)):
-    contact_email = await repository_contacts.get_contact_by_email(current_user, body.email, db)
-    contact_phone = await repository_contacts.get_contact_by_email(current_user, body.phone, db)
-    if contact_email or contact_phone:
+    if await repository_persons.get_person_by_id(body.person_id, db, current_user) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Person not found")
+    try:
+        contact = await repository_contacts.create(current_user, body, db)
+    except IntegrityError:
+        # ON CONFLICT absorbs the unique constraints, so this is the person deleted after the check above
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Person not found")
+    if contact is None:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Contact is exists")
-    contact = await repository_contacts.create(current_user, body, db)
     return contact
 
 
+@router.post("/import", response_model=ContactImportResponse)
+async def import_contacts(file: UploadFile, fmt: str = Query("csv", alias="format", regex="^(csv|ndjson)$"),
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    result = await repository_contacts.import_contacts(current_user, read_rows(file.file, fmt), db)
+    return result
+
+
+@router.put("/batch", response_model=BatchResponse)
+async def update_contacts(body: conlist(ContactBatchUpdate, min_items=1, max_items=1000),
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    try:
+        return await repository_contacts.update_many(current_user, body, db)
+    except IntegrityError as error:
+        await db.rollback()
+        if not unique_violation(error, "contacts"):
+            raise
+        # An email or phone taken by a contact created concurrently, after the conflict check
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Contact is exists")
+
+
+@router.patch("/batch/blacklist", response_model=BatchResponse)
+async def block_contacts(body: ContactBatchBlackList, db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(auth_service.get_current_user)):
+    return await repository_contacts.block_many(current_user, body, db)
+
+
+@router.post("/batch/delete", response_model=BatchResponse)
+async def delete_contacts(body: BatchIds, db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    return await repository_contacts.remove_many(current_user, body.ids, db)
+
+
 @router.put("/{contact_id}", response_model=ContactResponse)
-async def update_contact(body: ContactModel, contact_id: int = Path(ge=1), db: Session = Depends(get_db),
+async def update_contact(body: ContactModel, contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)):
-    contact = await repository_contacts.update(current_user, contact_id, body, db)
+    if await repository_persons.get_person_by_id(body.person_id, db, current_user) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Person not found")
+    try:
+        contact = await repository_contacts.update(current_user, contact_id, body, db)
+    except IntegrityError as error:
+        await db.rollback()
+        if unique_violation(error, "contacts"):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Contact is exists")
+        # The person was deleted after the check above
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Person not found")
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
     return contact
@@ -50,7 +136,7 @@ async def update_contact(body: ContactModel, contact_id: int = Path(ge=1), db: S
 
 @router.delete("/{contact_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_contact(current_user: User = Depends(auth_service.get_current_user), contact_id: int = Path(ge=1),
-                         db: Session = Depends(get_db)):
+                         db: AsyncSession = Depends(get_db)):
     contact = await repository_contacts.remove(current_user, contact_id, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
@@ -58,7 +144,7 @@ async def delete_contact(current_user: User = Depends(auth_service.get_current_u
 
 
 @router.patch("/{contact_id}/blacklist", response_model=ContactResponse)
-async def block_contact(body: ContactBlackList, contact_id: int = Path(ge=1), db: Session = Depends(get_db),
+async def block_contact(body: ContactBlackList, contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
                         current_user: User = Depends(auth_service.get_current_user)):
     contact = await repository_contacts.block(current_user, contact_id, body, db)
     if contact is None:
@@ -67,21 +153,44 @@ async def block_contact(body: ContactBlackList, contact_id: int = Path(ge=1), db
 
 
 @router.get("/search/", response_model=List[ContactResponse])
-async def search_contact(current_user: User = Depends(auth_service.get_current_user),
-                         find: str = Query(min_length=2, max_length=50), db: Session = Depends(get_db)):
-    contacts = await repository_contacts.search_contacts(current_user, find, db)
+async def search_contact(request: Request, current_user: User = Depends(auth_service.get_current_user),
+                         find: str = Query(min_length=2, max_length=50), limit: int = Query(10, le=300),
+                         offset: int = 0, fields: str | None = None, db: AsyncSession = Depends(get_read_db)):
+    selected = parse_fields(fields, repository_contacts.CONTACT_ROW_COLUMNS)
+    state = await repository_contacts.get_data_state(current_user, db)
+    etag = make_etag(*state, find, limit, offset, selected)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    contacts = await repository_contacts.search_contacts(current_user, find, limit, offset, db, load="rows",
+                                                         fields=selected)
     if contacts:
-        return contacts
+        response = ORJSONResponse(contacts)
+        set_cache_headers(response, etag)
+        return response
     else:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
 
 
 @router.get("/birthday/", response_model=List[ContactResponse])
-async def get_birthdays(current_user: User = Depends(auth_service.get_current_user), limit: int = Query(10, le=300),
-                        offset: int = 0, db: Session = Depends(get_db)):
-    contacts_id_list = await repository_contacts.get_contacts_hb_id_list(current_user, db)
-    contacts = await repository_contacts.get_contacts_hb(current_user, contacts_id_list, limit, offset, db)
+async def get_birthdays(request: Request, current_user: User = Depends(auth_service.get_current_user),
+                        limit: int = Query(10, le=300), offset: int = 0, fields: str | None = None,
+                        db: AsyncSession = Depends(get_read_db)):
+    selected = parse_fields(fields, repository_contacts.CONTACT_ROW_COLUMNS)
+    *state, digest_version = await repository_contacts.get_birthday_state(current_user, date.today(), db)
+    # The window moves every day, so the date is part of the validator
+    etag = make_etag(*state, date.today(), limit, offset, selected)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    # The daily digest is used while the user's contacts and persons are still at the version it was computed from
+    if digest_version == state[0]:
+        contacts = await repository_contacts.get_contacts_digest(current_user, date.today(), limit, offset, db,
+                                                                 load="rows", fields=selected)
+    else:
+        contacts = await repository_contacts.get_contacts_hb(current_user, limit, offset, db, load="rows",
+                                                             fields=selected)
     if contacts:
-        return contacts
+        response = ORJSONResponse(contacts)
+        set_cache_headers(response, etag)
+        return response
     else:
         raise HTTPException(status_code=status.HTTP_204_NO_CONTENT, detail="No content")
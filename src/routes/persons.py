@@ -1,53 +1,109 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, Path, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Path, status, Query, Request, Response
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from pydantic import conlist
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 from src.database.models import User
 from src.repository import persons as repository_persons
-from src.schemas import PersonModel, PersonResponse
+from src.schemas import PersonModel, PersonResponse, PersonBatchUpdate, BatchIds, BatchResponse
 from src.services.auth import auth_service
+from src.services.contacts_io import write_rows, gzip_stream, MEDIA_TYPES
+from src.services.etag import make_etag, etag_matches, set_cache_headers, not_modified
+from src.services.fields import parse_fields
+from src.services.pagination import decode_cursor, set_next_cursor
 
 router = APIRouter(prefix="/persons", tags=["persons"])
 
 
 @router.get("/", response_model=List[PersonResponse])
-async def get_persons(db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
-    persons = await repository_persons.get_persons(db, current_user)
-    return persons
+async def get_persons(request: Request, limit: int = Query(10, le=300), after: str | None = None,
+                      fields: str | None = None, db: AsyncSession = Depends(get_read_db),
+                      current_user: User = Depends(auth_service.get_current_user)):
+    selected = parse_fields(fields, repository_persons.PERSON_ROW_COLUMNS)
+    state = await repository_persons.get_persons_state(db, current_user)
+    etag = make_etag(*state, limit, after, selected)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    persons = await repository_persons.get_persons(db, current_user, limit, after=decode_cursor(after), load="rows",
+                                                   fields=selected)
+    response = ORJSONResponse(persons)
+    set_next_cursor(response, persons, limit)
+    set_cache_headers(response, etag)
+    return response
+
+
+@router.get("/export")
+async def export_persons(fmt: str = Query("csv", alias="format", regex="^(csv|ndjson)$"), gzip: bool = False,
+                        db: AsyncSession = Depends(get_read_db),
+                        current_user: User = Depends(auth_service.get_current_user)):
+    chunks = write_rows(repository_persons.stream_persons(db, current_user), repository_persons.EXPORT_FIELDS, fmt)
+    headers = {"Content-Disposition": f'attachment; filename="persons.{fmt}"'}
+    if gzip:
+        chunks = gzip_stream(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[fmt], headers=headers)
 
 
 @router.get("/{person_id}", response_model=PersonResponse)
-async def get_person(person_id: int = Path(ge=1), db: Session = Depends(get_db),
+async def get_person(request: Request, response: Response, person_id: int = Path(ge=1),
+                     db: AsyncSession = Depends(get_read_db),
                      current_user: User = Depends(auth_service.get_current_user)):
     person = await repository_persons.get_person_by_id(person_id, db, current_user)
     if person is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    etag = make_etag(person.id, person.updated_at)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_cache_headers(response, etag)
     return person
 
 
 @router.post("/", response_model=PersonResponse, status_code=status.HTTP_201_CREATED)
-async def create_person(body: PersonModel, db: Session = Depends(get_db),
+async def create_person(body: PersonModel, db: AsyncSession = Depends(get_db),
                         current_user: User = Depends(auth_service.get_current_user)):
-    person = await repository_persons.get_person_by_name(body.first_name, body.last_name, db, current_user)
-    if person:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="User is exists")
     person = await repository_persons.create(body, db, current_user)
+    if person is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="User is exists")
     return person
 
 
+@router.put("/batch", response_model=BatchResponse)
+async def update_persons(body: conlist(PersonBatchUpdate, min_items=1, max_items=1000),
+                         db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(auth_service.get_current_user)):
+    try:
+        return await repository_persons.update_many(body, db, current_user)
+    except IntegrityError:
+        # A name taken by a person created concurrently, after the conflict check
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="User is exists")
+
+
+@router.post("/batch/delete", response_model=BatchResponse)
+async def delete_persons(body: BatchIds, db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(auth_service.get_current_user)):
+    return await repository_persons.remove_many(body.ids, db, current_user)
+
+
 @router.put("/{person_id}", response_model=PersonResponse)
-async def update_person(body: PersonModel, person_id: int = Path(ge=1), db: Session = Depends(get_db),
+async def update_person(body: PersonModel, person_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
                         current_user: User = Depends(auth_service.get_current_user)):
-    person = await repository_persons.update(person_id, body, db, current_user)
+    try:
+        person = await repository_persons.update(person_id, body, db, current_user)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="User is exists")
     if person is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
     return person
 
 
 @router.delete("/{person_id}", response_model=PersonResponse)
-async def delete_person(person_id: int = Path(ge=1), db: Session = Depends(get_db),
+async def delete_person(person_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
                         current_user: User = Depends(auth_service.get_current_user)):
     person = await repository_persons.remove(person_id, db, current_user)
     if person is None:
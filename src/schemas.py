@@ -1,7 +1,7 @@
 import datetime
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, conlist
 
 
 class PersonModel(BaseModel):
@@ -18,6 +18,10 @@ class PersonResponse(BaseModel):
         orm_mode = True
 
 
+class PersonBatchUpdate(PersonModel):
+    id: int = Field(gt=0)
+
+
 class ContactModel(BaseModel):
     date_of_birth: datetime.date
     email: EmailStr
@@ -47,6 +51,37 @@ class ContactBlackList(BaseModel):
         orm_mode = True
 
 
+class ContactBatchUpdate(ContactModel):
+    id: int = Field(gt=0)
+
+
+class BatchIds(BaseModel):
+    ids: conlist(int, min_items=1, max_items=1000)
+
+
+class ContactBatchBlackList(BatchIds):
+    blocked: bool = False
+
+
+class BatchOutcome(BaseModel):
+    id: int
+    status: str
+
+
+class BatchResponse(BaseModel):
+    results: List[BatchOutcome]
+
+
+class ImportRowError(BaseModel):
+    row: int
+    detail: str
+
+
+class ContactImportResponse(BaseModel):
+    imported: int = 0
+    errors: List[ImportRowError] = []
+
+
 class UserModel(BaseModel):
     username: str = Field(min_length=5, max_length=16)
     email: EmailStr
@@ -57,7 +92,7 @@ class UserResponse(BaseModel):
     id: int
     username: str
     email: EmailStr
-    avatar: str
+    avatar: Optional[str] = None
 
     class Config:
         orm_mode = True
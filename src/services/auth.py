@@ -1,82 +1,141 @@
+import asyncio
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
 from typing import Optional
 
-from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.repository import users as repository_users
+from src.services.cache import user_cache
+from src.services.tokens import load_keys, token_cache, revoked_tokens
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    SECRET_KEY = "secret_key"
-    ALGORITHM = "HS256"
+    HASH_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+    HASH_WORKERS = int(os.environ.get("BCRYPT_WORKERS", 4))
+    # bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop
+    hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="password-hash")
+    ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-    def verify_password(self, plain_password, hashed_password):
-        return self.pwd_context.verify(plain_password, hashed_password)
+    # passlib and python-jose (with its cryptography backend) are imported on first use, not with the app
 
-    def get_password_hash(self, password: str):
-        return self.pwd_context.hash(password)
+    @cached_property
+    def pwd_context(self):
+        from passlib.context import CryptContext
+
+        return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=self.HASH_ROUNDS)
+
+    @cached_property
+    def keys(self):
+        """(signing key, verifying key), parsed once."""
+        return load_keys(self.ALGORITHM)
+
+    async def _run_hashing(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.hash_executor, func, *args)
+
+    async def verify_password(self, plain_password, hashed_password):
+        return await self._run_hashing(self.pwd_context.verify, plain_password, hashed_password)
+
+    async def verify_and_update_password(self, plain_password, hashed_password):
+        """
+        Returns (valid, new_hash); new_hash is set when the stored hash is deprecated,
+        e.g. created with fewer rounds than HASH_ROUNDS, and should replace it.
+        """
+        return await self._run_hashing(self.pwd_context.verify_and_update, plain_password, hashed_password)
+
+    async def get_password_hash(self, password: str):
+        return await self._run_hashing(self.pwd_context.hash, password)
 
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
+        from jose import jwt
+
         to_encode = data.copy()
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
             expire = datetime.utcnow() + timedelta(minutes=60)
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"})
-        encoded_access_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        # jti identifies the token in the revocation list
+        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token", "jti": uuid.uuid4().hex})
+        encoded_access_token = jwt.encode(to_encode, self.keys[0], algorithm=self.ALGORITHM)
         return encoded_access_token
 
     # define a function to generate a new refresh token
     async def create_refresh_token(self, data: dict, expires_delta: Optional[float] = None):
+        from jose import jwt
+
         to_encode = data.copy()
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
             expire = datetime.utcnow() + timedelta(days=7)
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
-        encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token", "jti": uuid.uuid4().hex})
+        encoded_refresh_token = jwt.encode(to_encode, self.keys[0], algorithm=self.ALGORITHM)
         return encoded_refresh_token
 
+    async def decode_token(self, token: str) -> dict:
+        """
+        Claims of a valid, not revoked token. The signature is checked once per token, later calls
+        are answered from token_cache until the token expires.
+        """
+        payload = token_cache.get(token)
+        if payload is None:
+            from jose import JWTError, jwt
+
+            try:
+                payload = jwt.decode(token, self.keys[1], algorithms=[self.ALGORITHM])
+            except JWTError:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials',
+                                    headers={"WWW-Authenticate": "Bearer"})
+            token_cache.set(token, payload)
+        if payload.get("jti") in revoked_tokens:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Token has been revoked',
+                                headers={"WWW-Authenticate": "Bearer"})
+        return payload
+
     async def decode_refresh_token(self, refresh_token: str):
-        try:
-            payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'refresh_token':
-                email = payload['sub']
-                return email
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
-        except JWTError:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
-
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+        payload = await self.decode_token(refresh_token)
+        if payload['scope'] == 'refresh_token':
+            email = payload['sub']
+            return email
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
+
+    async def revoke_token(self, token: str, db: AsyncSession) -> None:
+        payload = await self.decode_token(token)
+        if "jti" not in payload:
+            # Issued before tokens carried an id, it can only expire
+            return
+        expires_at = datetime.utcfromtimestamp(payload["exp"])
+        await repository_users.revoke_token(payload["jti"], expires_at, db)
+        revoked_tokens.add(payload["jti"], payload["exp"])
+
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-        try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
-                    raise credentials_exception
-            else:
-                raise credentials_exception
-        except JWTError as e:
+        # Raises 401 itself for invalid and revoked tokens
+        payload = await self.decode_token(token)
+        if payload['scope'] != 'access_token' or payload.get("sub") is None:
             raise credentials_exception
+        email = payload["sub"]
 
-        user = await repository_users.get_user_by_email(email, db)
+        user = await user_cache.get(email)
         if user is None:
-            raise credentials_exception
+            user = await repository_users.get_user_by_email(email, db)
+            if user is None:
+                raise credentials_exception
+            await user_cache.set(user)
         return user
 
 
@@ -0,0 +1,71 @@
+import json
+import time
+from collections import OrderedDict
+
+from src.database.models import User
+
+
+class MemoryBackend:
+    """
+    In-process TTL + LRU store with the subset of the redis.asyncio client API used by the caches,
+    so a Redis client can be passed instead without changing the callers.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, tuple[str, float | None]] = OrderedDict()
+
+    async def get(self, name: str) -> str | None:
+        item = self._data.get(name)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[name]
+            return None
+        self._data.move_to_end(name)
+        return value
+
+    async def set(self, name: str, value: str, ex: int | None = None) -> None:
+        expires_at = time.monotonic() + ex if ex else None
+        self._data[name] = (value, expires_at)
+        self._data.move_to_end(name)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def delete(self, *names: str) -> None:
+        for name in names:
+            self._data.pop(name, None)
+
+
+class UserCache:
+    """Resolved users keyed by token subject (email), so authenticated requests skip the users query."""
+    KEY_PREFIX = "user:"
+    FIELDS = ("id", "username", "email", "avatar")
+
+    def __init__(self, backend=None, ttl: int = 300):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, email: str) -> User | None:
+        cached = await self.backend.get(self.KEY_PREFIX + email)
+        if cached is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return User(**json.loads(cached))
+
+    async def set(self, user: User) -> None:
+        data = {field: getattr(user, field) for field in self.FIELDS}
+        await self.backend.set(self.KEY_PREFIX + user.email, json.dumps(data), ex=self.ttl)
+
+    async def invalidate(self, email: str) -> None:
+        await self.backend.delete(self.KEY_PREFIX + email)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+user_cache = UserCache()
@@ -0,0 +1,83 @@
+import csv
+import io
+import itertools
+import json
+import re
+import zlib
+from datetime import date, datetime
+from typing import AsyncIterator, BinaryIO, Iterator, Sequence
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+# Bytes that are not UTF-8, as decoded by the surrogateescape error handler
+UNDECODABLE = re.compile("[\udc80-\udcff]")
+
+
+def read_rows(file: BinaryIO, fmt: str) -> Iterator[tuple[int, dict | None]]:
+    """
+    Lazily yields (row number, raw row) from an uploaded CSV (with header) or NDJSON file.
+    Rows that cannot be parsed, including rows that are not valid UTF-8, are yielded as None so the caller
+    can report them: raising here would fail the import after its earlier chunks were committed.
+    """
+    # Invalid bytes decode to lone surrogates instead of raising, the rows holding them are rejected below
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", errors="surrogateescape", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for number in itertools.count(1):
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error:
+                yield number, None
+                continue
+            if any(UNDECODABLE.search(value) for value in row.values() if isinstance(value, str)):
+                yield number, None
+                continue
+            # Empty cells fall back to the model defaults
+            yield number, {key: value for key, value in row.items() if key and value not in ("", None)}
+    else:
+        for number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = None if UNDECODABLE.search(line) else json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else None
+
+
+def _plain(value):
+    # Exported dates use the same format the import accepts
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+async def write_rows(partitions: AsyncIterator[Sequence], fields: Sequence[str], fmt: str) -> AsyncIterator[bytes]:
+    """Serializes partitions of plain row tuples into CSV (with header) or NDJSON, one chunk per partition."""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        async for partition in partitions:
+            writer.writerows([_plain(value) for value in row] for row in partition)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+    else:
+        async for partition in partitions:
+            lines = (json.dumps(dict(zip(fields, map(_plain, row)))) for row in partition)
+            yield ("\n".join(lines) + "\n").encode()
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
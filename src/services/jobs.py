@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    name: str
+    kwargs: dict = field(default_factory=dict)
+    attempts: int = 0
+
+
+class MemoryBackend:
+    """
+    asyncio.Queue holding the jobs of this process. Another backend (e.g. a Redis list) only needs
+    the same put/get/ack/join coroutines; jobs are plain name + kwargs so they can be serialized.
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue[Job] = asyncio.Queue()
+
+    async def put(self, job: Job) -> None:
+        await self._queue.put(job)
+
+    async def get(self) -> Job:
+        return await self._queue.get()
+
+    async def ack(self, job: Job) -> None:
+        self._queue.task_done()
+
+    async def join(self) -> None:
+        await self._queue.join()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+
+class JobQueue:
+    """
+    Runs post-request work (e.g. signup side effects) on a pool of worker tasks. Handlers are coroutines
+    registered with @job_queue.task and get their own session as the first argument. A failed job is
+    retried with exponential backoff and dropped with an error log after max_attempts, a job without a
+    registered handler is dropped right away.
+    """
+
+    def __init__(self, backend=None, workers: int = 2, max_attempts: int = 5, backoff: float = 1.0,
+                 max_backoff: float = 60.0):
+        self.backend = backend or MemoryBackend()
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.handlers = {}
+        self.session_maker = None
+        self._workers: list[asyncio.Task] = []
+        # Retry sleeps and the job each one puts back on the queue
+        self._retries: dict[asyncio.Task, Job] = {}
+        self.done = 0
+        self.failed = 0
+
+    def task(self, func):
+        self.handlers[func.__name__] = func
+        return func
+
+    async def enqueue(self, func, **kwargs) -> None:
+        await self.backend.put(Job(func.__name__, kwargs))
+
+    def start(self, session_maker) -> None:
+        self.session_maker = session_maker
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """
+        Gives queued jobs and jobs waiting for a retry up to timeout seconds to finish, then cancels the workers
+        and the pending retries, logging the jobs dropped with them.
+        """
+        if self._workers:
+            try:
+                await asyncio.wait_for(self._drain(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Job queue stopped with %d job(s) left", self.backend.qsize())
+                for job in self._retries.values():
+                    logger.error("Job %s%s dropped before attempt %d", job.name, job.kwargs, job.attempts + 1)
+        for task in [*self._workers, *self._retries]:
+            task.cancel()
+        self._workers = []
+
+    async def _drain(self) -> None:
+        # A failed job is acked before its retry puts it back, so the queue is joined again after the retries
+        await self.backend.join()
+        while self._retries:
+            await asyncio.wait(list(self._retries))
+            await self.backend.join()
+
+    async def _work(self) -> None:
+        while True:
+            job = await self.backend.get()
+            try:
+                await self.run(job)
+            finally:
+                await self.backend.ack(job)
+
+    async def run(self, job: Job) -> None:
+        job.attempts += 1
+        handler = self.handlers.get(job.name)
+        if handler is None:
+            # Retrying cannot help, e.g. a job enqueued by a newer version of the code
+            self.failed += 1
+            logger.error("Job %s%s has no handler, dropped", job.name, job.kwargs)
+            return
+        try:
+            async with self.session_maker() as db:
+                await handler(db, **job.kwargs)
+            self.done += 1
+        except Exception as e:
+            if job.attempts >= self.max_attempts:
+                self.failed += 1
+                logger.error("Job %s%s failed after %d attempts: %s", job.name, job.kwargs, job.attempts, e)
+                return
+            delay = min(self.backoff * 2 ** (job.attempts - 1), self.max_backoff)
+            logger.warning("Job %s%s failed (%s), retrying in %.1fs", job.name, job.kwargs, e, delay)
+            retry = asyncio.create_task(self._retry(job, delay))
+            self._retries[retry] = job
+            retry.add_done_callback(self._retries.pop)
+
+    async def _retry(self, job: Job, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self.backend.put(job)
+
+    def stats(self) -> dict:
+        return {"done": self.done, "failed": self.failed}
+
+
+job_queue = JobQueue(workers=int(os.environ.get("JOB_WORKERS", 2)),
+                     max_attempts=int(os.environ.get("JOB_MAX_ATTEMPTS", 5)))
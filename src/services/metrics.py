@@ -0,0 +1,221 @@
+import hashlib
+import logging
+import os
+import re
+import secrets
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", 0.5))
+# Clients allowed to read the metrics without a token, behind a proxy uvicorn takes the address from
+# X-Forwarded-For when the proxy is in its --forwarded-allow-ips
+METRICS_ALLOWED_HOSTS = {host.strip() for host in os.environ.get("METRICS_ALLOWED_HOSTS", "127.0.0.1,::1").split(",")
+                         if host.strip()}
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+
+@dataclass
+class RequestStats:
+    statements: int = 0
+    db_time: float = 0.0
+    fingerprints: Counter = field(default_factory=Counter)
+
+
+current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+
+def fingerprint(statement: str) -> str:
+    """Statement shape without literals and expanded IN lists, prefixed with a short hash for grepping."""
+    shape = re.sub(r"\s+", " ", statement).strip()
+    shape = re.sub(r"'[^']*'|\b\d+\b", "?", shape)
+    shape = re.sub(r"\((?:\s*(?:\?|\$\d+|%\(\w+\)s|:\w+)\s*,?)+\)", "(...)", shape)
+    return f"{hashlib.md5(shape.encode()).hexdigest()[:8]} {shape[:200]}"
+
+
+class RequestMetrics:
+    """Per-route latency histograms and SQL counters, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self.buckets = defaultdict(lambda: [0] * len(LATENCY_BUCKETS))
+        self.count = Counter()
+        self.duration = defaultdict(float)
+        self.statements = Counter()
+        self.db_time = defaultdict(float)
+
+    def observe(self, key: tuple[str, str, str], seconds: float, stats: RequestStats) -> None:
+        buckets = self.buckets[key]
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                buckets[i] += 1
+        self.count[key] += 1
+        self.duration[key] += seconds
+        self.statements[key] += stats.statements
+        self.db_time[key] += stats.db_time
+
+    def render(self) -> list[str]:
+        lines = ["# TYPE http_request_duration_seconds histogram"]
+        for key in sorted(self.count):
+            labels = 'method="{}",route="{}",status="{}"'.format(*key)
+            for bound, value in zip(LATENCY_BUCKETS, self.buckets[key]):
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {value}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {self.count[key]}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {self.duration[key]:.6f}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {self.count[key]}")
+        lines.append("# TYPE http_request_sql_statements_total counter")
+        for key in sorted(self.count):
+            labels = 'method="{}",route="{}",status="{}"'.format(*key)
+            lines.append(f"http_request_sql_statements_total{{{labels}}} {self.statements[key]}")
+        lines.append("# TYPE http_request_db_seconds_total counter")
+        for key in sorted(self.count):
+            labels = 'method="{}",route="{}",status="{}"'.format(*key)
+            lines.append(f"http_request_db_seconds_total{{{labels}}} {self.db_time[key]:.6f}")
+        return lines
+
+
+request_metrics = RequestMetrics()
+
+
+class PoolMetrics:
+    """Counters for connection checkout waits and the age of open connections of one engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.connected_at: dict[int, float] = {}
+
+    def record_wait(self, seconds: float) -> None:
+        self.waits += 1
+        self.wait_time_total += seconds
+        self.wait_time_max = max(self.wait_time_max, seconds)
+
+    def snapshot(self) -> dict:
+        # The engine replaces its pool on dispose, the counters here outlive it
+        pool = self.engine.sync_engine.pool
+        now = time.monotonic()
+        ages = [now - connected_at for connected_at in self.connected_at.values()]
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "checkouts": self.waits,
+            "wait_seconds_total": round(self.wait_time_total, 6),
+            "wait_seconds_max": round(self.wait_time_max, 6),
+            "connections": len(ages),
+            "connection_age_seconds_max": round(max(ages, default=0.0), 3),
+            "connection_age_seconds_avg": round(sum(ages) / len(ages), 3) if ages else 0.0,
+        }
+
+
+# Metrics of the engines created so far by label, "primary" and "replica-N"
+pool_metrics: dict[str, PoolMetrics] = {}
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that times how long each checkout waits for a free connection."""
+
+    metrics: PoolMetrics | None = None
+
+    def recreate(self):
+        # dispose() swaps in a new pool, which keeps reporting to the same metrics
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - started)
+
+
+def instrument_engine(engine, label: str | None = None) -> None:
+    """Times the statements of the engine for the request metrics, and its pool for pool_metrics[label] if given."""
+    if label is not None:
+        metrics = pool_metrics[label] = PoolMetrics(engine)
+        engine.sync_engine.pool.metrics = metrics
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            metrics.connected_at[id(connection_record)] = time.monotonic()
+
+        @event.listens_for(engine.sync_engine, "close")
+        def on_close(dbapi_connection, connection_record):
+            metrics.connected_at.pop(id(connection_record), None)
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        stats = current_request.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_time += elapsed
+            stats.fingerprints[fingerprint(statement)] += 1
+
+
+async def metrics_middleware(request: Request, call_next):
+    stats = RequestStats()
+    token = current_request.set(stats)
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        current_request.reset(token)
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        request_metrics.observe((request.method, route_path, str(status_code)), elapsed, stats)
+        if elapsed >= SLOW_REQUEST_SECONDS:
+            logger.warning("Slow request %s %s: %.3fs, %d SQL statements, %.3fs in DB\n%s",
+                           request.method, route_path, elapsed, stats.statements, stats.db_time,
+                           "\n".join(f"  {count}x {fp}" for fp, count in stats.fingerprints.most_common(10)))
+
+
+def require_metrics_access(request: Request) -> None:
+    """
+    Dependency of the metrics endpoints: allows METRICS_ALLOWED_HOSTS, or any client sending
+    "Authorization: Bearer <METRICS_TOKEN>" when the token is set.
+    """
+    if request.client is not None and request.client.host in METRICS_ALLOWED_HOSTS:
+        return
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    if METRICS_TOKEN and scheme.lower() == "bearer" and secrets.compare_digest(credentials, METRICS_TOKEN):
+        return
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+
+def pool_snapshots() -> dict[str, dict]:
+    return {label: metrics.snapshot() for label, metrics in pool_metrics.items()}
+
+
+def render_prometheus(user_cache, token_cache) -> str:
+    lines = request_metrics.render()
+    snapshots = pool_snapshots()
+    for name in next(iter(snapshots.values()), {}):
+        lines.append(f"# TYPE db_pool_{name} gauge")
+        lines.extend(f'db_pool_{name}{{engine="{label}"}} {snapshot[name]}' for label, snapshot in snapshots.items())
+    for prefix, cache in (("user_cache", user_cache), ("token_cache", token_cache)):
+        for name, value in cache.stats().items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+    return "\n".join(lines) + "\n"
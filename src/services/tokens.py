@@ -0,0 +1,116 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from src.repository import users as repository_users
+
+logger = logging.getLogger(__name__)
+
+
+def load_keys(algorithm: str):
+    """
+    Signing and verifying keys for the algorithm, parsed once so encoding and decoding skip the key parsing.
+    HS* use the JWT_SECRET_KEY shared secret, RS*/ES* the PEM files named by JWT_PRIVATE_KEY_FILE and
+    JWT_PUBLIC_KEY_FILE; a process that only verifies tokens needs just the public key.
+    """
+    from jose import jwk
+
+    if algorithm.startswith("HS"):
+        key = jwk.construct(os.environ.get("JWT_SECRET_KEY", "secret_key"), algorithm)
+        return key, key
+    private_file = os.environ.get("JWT_PRIVATE_KEY_FILE")
+    public_file = os.environ["JWT_PUBLIC_KEY_FILE"]
+    with open(public_file) as f:
+        verifying_key = jwk.construct(f.read(), algorithm)
+    signing_key = None
+    if private_file:
+        with open(private_file) as f:
+            signing_key = jwk.construct(f.read(), algorithm)
+    return signing_key, verifying_key
+
+
+class TokenCache:
+    """Claims of already verified tokens keyed by the token's sha256, each kept until the token expires."""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, dict] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> dict | None:
+        key = self.key(token)
+        payload = self._data.get(key)
+        if payload is not None and payload["exp"] <= time.time():
+            del self._data[key]
+            payload = None
+        if payload is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return payload
+
+    def peek(self, token: str) -> dict | None:
+        """Claims of a cached token that has not expired, without counting a hit or a miss."""
+        payload = self._data.get(self.key(token))
+        return payload if payload is not None and payload["exp"] > time.time() else None
+
+    def set(self, token: str, payload: dict) -> None:
+        key = self.key(token)
+        self._data[key] = payload
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class RevocationList:
+    """
+    jti of revoked tokens that have not expired yet. Revocations made by this process are added directly,
+    the ones made by other workers arrive with the periodic sync from the revoked_tokens table.
+    """
+
+    def __init__(self, sync_interval: float = 30):
+        self.sync_interval = sync_interval
+        self._revoked: dict[str, float] = {}
+
+    def __contains__(self, jti: str | None) -> bool:
+        return jti is not None and jti in self._revoked
+
+    def add(self, jti: str, expires_at: float) -> None:
+        self._revoked[jti] = expires_at
+
+    def prune(self) -> None:
+        now = time.time()
+        self._revoked = {jti: expires_at for jti, expires_at in self._revoked.items() if expires_at > now}
+
+    async def sync(self, db) -> None:
+        # Merged rather than replaced, a revocation committed while the query ran must not be dropped
+        for jti, expires_at in await repository_users.get_revoked_tokens(db, datetime.utcnow()):
+            # Stored as naive UTC, like the token timestamps
+            self._revoked[jti] = expires_at.replace(tzinfo=timezone.utc).timestamp()
+        self.prune()
+
+    async def run(self, session_maker) -> None:
+        while True:
+            try:
+                async with session_maker() as db:
+                    await self.sync(db)
+            except Exception as e:
+                logger.error("Revoked tokens sync failed: %s", e)
+            await asyncio.sleep(self.sync_interval)
+
+
+token_cache = TokenCache(maxsize=int(os.environ.get("TOKEN_CACHE_SIZE", 10000)))
+revoked_tokens = RevocationList(sync_interval=float(os.environ.get("REVOCATION_SYNC_SECONDS", 30)))
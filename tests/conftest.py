@@ -0,0 +1,57 @@
+"""
+Harness of the tests: the app served in-process through an ASGI client against a seeded SQLite database,
+the same setup as benchmarks/bench_api.py, so no PostgreSQL is needed.
+"""
+import httpx
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from benchmarks.bench_api import sqlite_engine, seed, login
+from main import app
+from src.database.db import get_db
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def engine(tmp_path_factory):
+    engine = sqlite_engine(tmp_path_factory.mktemp("db") / "test.db")
+    await seed(engine, users=2, persons=50, contacts=1000)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture(scope="session")
+async def client(engine):
+    session_maker = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async def get_test_db():
+        async with session_maker() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = get_test_db
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture(scope="session")
+async def headers(client):
+    return {"Authorization": f"Bearer {await login(client, 1)}"}
+
+
+@pytest.fixture
+def statements(engine):
+    """SQL statements executed while the test runs."""
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    yield captured
+    event.remove(engine.sync_engine, "before_cursor_execute", capture)
@@ -0,0 +1,18 @@
+"""Month-day windows of the birthday queries across the end of February and the end of the year."""
+from datetime import date
+
+from src.repository.contacts import birthday_window
+
+
+def test_feb_29_before_mar_1_in_non_leap_year():
+    assert birthday_window(date(2027, 2, 25)) == [225, 226, 227, 228, 229, 301, 302, 303, 304]
+
+
+def test_wraps_into_january():
+    assert birthday_window(date(2026, 12, 28)) == [1228, 1229, 1230, 1231, 101, 102, 103, 104]
+
+
+def test_feb_29_once_in_leap_year():
+    window = birthday_window(date(2028, 2, 25))
+    assert window == [225, 226, 227, 228, 229, 301, 302, 303]
+    assert window.count(229) == 1
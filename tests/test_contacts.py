@@ -0,0 +1,34 @@
+"""Failures of the contact writes: a person the user does not own is not found, a taken email or phone conflicts."""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+# Persons 1-50 belong to user 1 and 51-100 to user 2, contact 2 of user 1 holds c0_1@example.com
+UNKNOWN_PERSON, OTHER_USERS_PERSON = 9999, 51
+
+
+def contact(**values) -> dict:
+    return {"date_of_birth": "1990-05-17", "email": "new@example.com", "phone": "+15550000000", "person_id": 1,
+            **values}
+
+
+@pytest.mark.parametrize("person_id", [UNKNOWN_PERSON, OTHER_USERS_PERSON])
+async def test_create_with_foreign_person(client, headers, person_id):
+    response = await client.post("/api/contacts/", json=contact(person_id=person_id), headers=headers)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Person not found"
+
+
+@pytest.mark.parametrize("person_id", [UNKNOWN_PERSON, OTHER_USERS_PERSON])
+async def test_update_with_foreign_person(client, headers, person_id):
+    response = await client.put("/api/contacts/1", json=contact(person_id=person_id), headers=headers)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Person not found"
+    response = await client.get("/api/contacts/1", headers=headers)
+    assert response.json()["person"]["id"] == 1
+
+
+async def test_update_with_taken_email(client, headers):
+    response = await client.put("/api/contacts/1", json=contact(email="c0_1@example.com"), headers=headers)
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Contact is exists"
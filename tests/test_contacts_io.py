@@ -0,0 +1,41 @@
+"""Uploads that are not UTF-8 or not valid CSV are reported row by row instead of failing the import."""
+import io
+
+import pytest
+
+from src.services.contacts_io import read_rows
+
+HEADER = b"date_of_birth,email,phone,person_id\n"
+
+
+def rows(data: bytes, fmt: str = "csv") -> list:
+    return list(read_rows(io.BytesIO(data), fmt))
+
+
+def test_csv_row_not_utf8():
+    data = HEADER + b"1990-01-01,a@example.com,+1,1\n" b"1990-01-02,\xff\xfe@example.com,+2,1\n" \
+        b"1990-01-03,c@example.com,+3,1\n"
+    result = rows(data)
+    assert [number for number, row in result if row is None] == [2]
+    assert [row["email"] for number, row in result if row] == ["a@example.com", "c@example.com"]
+
+
+def test_csv_error_skips_only_its_row():
+    data = HEADER + b'1990-01-01,"' + b"x" * 200_000 + b'",+1,1\n1990-01-02,b@example.com,+2,1\n'
+    result = rows(data)
+    assert result[0] == (1, None)
+    assert result[1][1]["email"] == "b@example.com"
+
+
+def test_ndjson_line_not_utf8():
+    data = b'{"email": "a@example.com"}\n{"email": "\xff@example.com"}\n'
+    assert rows(data, "ndjson") == [(1, {"email": "a@example.com"}), (2, None)]
+
+
+@pytest.mark.anyio
+async def test_import_of_utf16_file(client, headers):
+    data = "﻿date_of_birth,email,phone,person_id\n1990-01-01,utf16@example.com,+1,1\n".encode("utf-16-le")
+    response = await client.post("/api/contacts/import", files={"file": ("contacts.csv", data)}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["imported"] == 0
+    assert response.json()["errors"]
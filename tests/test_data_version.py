@@ -0,0 +1,24 @@
+"""Writes that change nothing keep the data version, so the list validators of the user stay valid."""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+NO_OP_WRITES = [
+    # Name0 Surname0 is person 1 of user 1, contact 1 holds c0_0@example.com
+    ("POST", "/api/persons/", {"first_name": "Name0", "last_name": "Surname0"}, 409),
+    ("POST", "/api/contacts/", {"date_of_birth": "1990-05-17", "email": "c0_0@example.com", "phone": "+1",
+                                "person_id": 1}, 409),
+    ("PATCH", "/api/contacts/batch/blacklist", {"ids": [999999], "blocked": True}, 200),
+    ("POST", "/api/contacts/batch/delete", {"ids": [999999]}, 200),
+    ("POST", "/api/persons/batch/delete", {"ids": [999999]}, 200),
+]
+
+
+@pytest.mark.parametrize("method, path, body, expected", NO_OP_WRITES)
+@pytest.mark.parametrize("listed", ["/api/contacts/", "/api/persons/"])
+async def test_no_op_write_keeps_etag(client, headers, method, path, body, expected, listed):
+    etag = (await client.get(listed, headers=headers)).headers["etag"]
+    response = await client.request(method, path, json=body, headers=headers)
+    assert response.status_code == expected
+    response = await client.get(listed, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
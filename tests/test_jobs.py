@@ -0,0 +1,82 @@
+"""JobQueue retries failed jobs with exponential backoff, drops them after max_attempts and drains on stop()."""
+import asyncio
+import contextlib
+import logging
+import time
+
+import pytest
+
+from src.services.jobs import Job, JobQueue
+
+pytestmark = pytest.mark.anyio
+
+
+def make_queue(failures: int, **options):
+    """Queue with a flaky handler that fails its first `failures` calls, and the times it was called at."""
+    queue = JobQueue(workers=1, **options)
+    calls = []
+
+    @queue.task
+    async def flaky(db, **kwargs):
+        calls.append(time.monotonic())
+        if len(calls) <= failures:
+            raise RuntimeError("boom")
+
+    # Handlers get a session, these ones do not use it
+    queue.start(lambda: contextlib.nullcontext())
+    return queue, flaky, calls
+
+
+async def wait_for_calls(calls: list, count: int) -> None:
+    while len(calls) < count:
+        await asyncio.sleep(0.005)
+
+
+async def test_retry_with_backoff():
+    queue, flaky, calls = make_queue(failures=2, backoff=0.05)
+    await queue.enqueue(flaky, contact_id=1)
+    await queue.stop()
+    assert len(calls) == 3
+    assert queue.stats() == {"done": 1, "failed": 0}
+    # Delays double from backoff: 0.05s then 0.1s
+    assert calls[1] - calls[0] >= 0.05
+    assert calls[2] - calls[1] >= 0.1
+
+
+async def test_dropped_after_max_attempts(caplog):
+    queue, flaky, calls = make_queue(failures=10, max_attempts=3, backoff=0.01)
+    await queue.enqueue(flaky, contact_id=1)
+    await queue.stop()
+    assert len(calls) == 3
+    assert queue.stats() == {"done": 0, "failed": 1}
+    assert "failed after 3 attempts" in caplog.text
+
+
+async def test_unknown_handler_dropped(caplog):
+    queue, flaky, calls = make_queue(failures=0, backoff=0.01)
+    await queue.backend.put(Job("removed_handler", {"contact_id": 1}))
+    await queue.stop()
+    assert queue.stats() == {"done": 0, "failed": 1}
+    assert not queue._retries
+    assert "has no handler, dropped" in caplog.text
+
+
+async def test_stop_waits_for_pending_retry():
+    queue, flaky, calls = make_queue(failures=1, backoff=0.2)
+    await queue.enqueue(flaky, contact_id=1)
+    await wait_for_calls(calls, 1)
+    # The queue is empty now, only the retry sleeping for 0.2s is pending
+    await queue.stop(timeout=5)
+    assert len(calls) == 2
+    assert queue.stats() == {"done": 1, "failed": 0}
+
+
+async def test_stop_timeout_drops_pending_retry(caplog):
+    caplog.set_level(logging.WARNING)
+    queue, flaky, calls = make_queue(failures=1, backoff=10)
+    await queue.enqueue(flaky, contact_id=1)
+    await wait_for_calls(calls, 1)
+    await queue.stop(timeout=0.1)
+    assert len(calls) == 1
+    assert queue.stats() == {"done": 0, "failed": 0}
+    assert "dropped before attempt 2" in caplog.text
@@ -0,0 +1,36 @@
+"""Pool metrics are kept and reported per engine."""
+import pytest
+from sqlalchemy import text
+
+from src.database.db import make_engine
+from src.services.metrics import pool_metrics
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def engines(tmp_path):
+    engines = {label: make_engine(f"sqlite+aiosqlite:///{tmp_path / label}.db", label)
+               for label in ("test-primary", "test-replica-1")}
+    yield engines
+    for label, engine in engines.items():
+        await engine.dispose()
+        del pool_metrics[label]
+
+
+async def test_pool_metrics_per_engine(client, engines):
+    for _ in range(3):
+        async with engines["test-primary"].connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    async with engines["test-replica-1"].connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+    pools = (await client.get("/api/metrics/pool")).json()
+    assert pools["test-primary"]["checkouts"] == 3
+    assert pools["test-replica-1"]["checkouts"] == 1
+    assert pools["test-replica-1"]["connections"] == 1
+
+    body = (await client.get("/metrics")).text
+    assert body.count("# TYPE db_pool_checkouts gauge") == 1
+    assert 'db_pool_checkouts{engine="test-primary"} 3' in body
+    assert 'db_pool_checkouts{engine="test-replica-1"} 1' in body
@@ -0,0 +1,46 @@
+"""
+SQL statements per request of the list endpoints, so a query per listed row or an extra round trip fails here
+rather than under load. Every endpoint is called once first to fill the user and token caches.
+"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+LIST_ENDPOINTS = [
+    # Data version of the user + the page
+    ("/api/contacts/", {}, 2),
+    ("/api/contacts/", {"fields": "email,person"}, 2),
+    ("/api/contacts/search/", {"find": "Name1"}, 2),
+    # Data version with the version of today's digest (none in the tests) + the birthdays in the window
+    ("/api/contacts/birthday/", {}, 2),
+    ("/api/persons/", {}, 2),
+]
+
+
+@pytest.mark.parametrize("path, params, expected", LIST_ENDPOINTS)
+async def test_list_statements(client, headers, statements, path, params, expected):
+    await client.get(path, params=params, headers=headers)
+    for limit in (10, 100):
+        statements.clear()
+        response = await client.get(path, params={**params, "limit": limit}, headers=headers)
+        assert response.status_code == 200
+        assert len(statements) == expected, statements
+
+
+@pytest.mark.parametrize("path, params, expected", LIST_ENDPOINTS)
+async def test_not_modified_statements(client, headers, statements, path, params, expected):
+    response = await client.get(path, params=params, headers=headers)
+    statements.clear()
+    response = await client.get(path, params=params, headers={**headers, "If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+    # Only the data version is read
+    assert len(statements) == 1, statements
+
+
+@pytest.mark.parametrize("path", ["/api/contacts/export", "/api/persons/export"])
+async def test_export_statements(client, headers, statements, path):
+    await client.get(path, headers=headers)
+    statements.clear()
+    response = await client.get(path, headers=headers)
+    assert response.status_code == 200
+    assert len(statements) == 1, statements
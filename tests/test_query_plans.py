@@ -0,0 +1,141 @@
+"""
+Index use of the repository read queries: every statement they emit is run through EXPLAIN QUERY PLAN on a seeded
+and ANALYZEd SQLite database and its SCAN/SEARCH lines must equal the expected ones. Pinning the index and the
+constraint of each lookup also catches reads of a whole index range, which a plain "no SCAN" check lets pass.
+
+Substring search runs on SQLite too, but only its shape is checked here: per-table arms scoped to the user and
+joined back by primary key. SQLite has no trigram indexes, so each arm reads the user's range; on PostgreSQL the
+arms have to show Bitmap Index Scans on the *_trgm indexes, check them there with EXPLAIN when changing the query.
+"""
+from datetime import date
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from benchmarks.bench_api import sqlite_engine, seed
+from src.database.models import User
+from src.repository import contacts, persons
+from src.repository.contacts import build_birthday_digest
+
+pytestmark = pytest.mark.anyio
+
+USER_PK = "SEARCH users USING INTEGER PRIMARY KEY (rowid=?)"
+CONTACT_PK = "SEARCH contacts USING INTEGER PRIMARY KEY (rowid=?)"
+PERSON_PK = "SEARCH persons USING INTEGER PRIMARY KEY (rowid=?)"
+
+# Query -> SCAN/SEARCH lines of each statement it executes, a tuple lists the lines equally good at that step
+EXPECTED_PLANS = {
+    "contacts.get_data_state": (
+        lambda user, db: contacts.get_data_state(user, db),
+        [[USER_PK]],
+    ),
+    "contacts.get_contacts": (
+        lambda user, db: contacts.get_contacts(user, 100, 0, db),
+        [["SEARCH contacts USING INDEX ix_contacts_user_id_id (user_id=?)"], [PERSON_PK]],
+    ),
+    "contacts.get_contacts after": (
+        lambda user, db: contacts.get_contacts(user, 100, 0, db, load="rows", after=500),
+        [["SEARCH contacts USING INDEX ix_contacts_user_id_id (user_id=? AND id>?)", PERSON_PK]],
+    ),
+    "contacts.get_contact_by_id": (
+        lambda user, db: contacts.get_contact_by_id(user, 42, db),
+        [[CONTACT_PK, "SEARCH persons_1 USING INTEGER PRIMARY KEY (rowid=?) LEFT-JOIN"]],
+    ),
+    "contacts.get_contact_by_email": (
+        lambda user, db: contacts.get_contact_by_email(user, "c0_42@example.com", db),
+        [["SEARCH contacts USING INDEX sqlite_autoindex_contacts_1 (user_id=? AND email=?)"]],
+    ),
+    "contacts.get_contact_by_phone": (
+        lambda user, db: contacts.get_contact_by_phone(user, "+3800000000042", db),
+        [["SEARCH contacts USING INDEX sqlite_autoindex_contacts_2 (user_id=? AND phone=?)"]],
+    ),
+    "contacts.search_contacts": (
+        lambda user, db: contacts.search_contacts(user, "Name7", 10, 0, db, load="rows"),
+        [[CONTACT_PK,
+          "SEARCH contacts USING INDEX ix_contacts_person_id (person_id=?)",
+          "SEARCH persons USING COVERING INDEX ix_persons_user_id_last_name_first_name (user_id=?)",
+          # The user's range of either (user_id, ...) index, SQLite costs them the same
+          ("SEARCH contacts USING INDEX ix_contacts_user_id_id (user_id=?)",
+           "SEARCH contacts USING INDEX ix_contacts_user_id_bday_md (user_id=?)"),
+          PERSON_PK]],
+    ),
+    "contacts.get_contacts_hb": (
+        lambda user, db: contacts.get_contacts_hb(user, 100, 0, db, load="rows"),
+        [["SEARCH contacts USING INDEX ix_contacts_user_id_bday_md (user_id=? AND bday_md=?)", PERSON_PK]],
+    ),
+    "contacts.get_contacts_digest": (
+        lambda user, db: contacts.get_contacts_digest(user, date.today(), 100, 0, db, load="rows"),
+        [["SEARCH birthday_digest USING COVERING INDEX sqlite_autoindex_birthday_digest_1 (user_id=? AND day=?)",
+          CONTACT_PK, PERSON_PK]],
+    ),
+    "persons.get_persons_state": (
+        lambda user, db: persons.get_persons_state(db, user),
+        [[USER_PK]],
+    ),
+    "persons.get_persons": (
+        lambda user, db: persons.get_persons(db, user, 100, after=10),
+        [["SEARCH persons USING INDEX ix_persons_user_id_id (user_id=? AND id>?)"]],
+    ),
+    "persons.get_person_by_id": (
+        lambda user, db: persons.get_person_by_id(7, db, user),
+        [[PERSON_PK]],
+    ),
+    "persons.get_person_by_name": (
+        lambda user, db: persons.get_person_by_name("Name7", "Surname7", db, user),
+        [["SEARCH persons USING INDEX sqlite_autoindex_persons_1 (user_id=? AND first_name=? AND last_name=?)"]],
+    ),
+    "persons.get_person_by_first_name": (
+        lambda user, db: persons.get_person_by_first_name("Name7", db, user),
+        [["SEARCH persons USING INDEX sqlite_autoindex_persons_1 (user_id=? AND first_name=?)"]],
+    ),
+    "persons.get_person_by_last_name": (
+        lambda user, db: persons.get_person_by_last_name("Surname7", db, user),
+        [["SEARCH persons USING INDEX ix_persons_user_id_last_name_first_name (user_id=? AND last_name=?)"]],
+    ),
+}
+
+
+def plan_matches(plans: list[list[str]], expected: list[list]) -> bool:
+    return len(plans) == len(expected) and all(
+        len(lines) == len(expected_lines) and all(
+            line in expected_line if isinstance(expected_line, tuple) else line == expected_line
+            for line, expected_line in zip(lines, expected_lines))
+        for lines, expected_lines in zip(plans, expected))
+
+
+@pytest.fixture(scope="module")
+async def plan_engine(tmp_path_factory):
+    # With only a few hundred persons SQLite rightly prefers scanning the table for a page of 100 ids
+    engine = sqlite_engine(tmp_path_factory.mktemp("plans") / "plans.db")
+    await seed(engine, users=3, persons=1000, contacts=2000)
+    async with async_sessionmaker(engine)() as db:
+        await build_birthday_digest(date.today(), db)
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE"))
+    yield engine
+    await engine.dispose()
+
+
+@pytest.mark.parametrize("name", EXPECTED_PLANS)
+async def test_query_plan(plan_engine, name):
+    query, expected = EXPECTED_PLANS[name]
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    async with async_sessionmaker(plan_engine, autoflush=False, expire_on_commit=False)() as db:
+        user = await db.get(User, 1)
+        event.listen(plan_engine.sync_engine, "before_cursor_execute", capture)
+        try:
+            await query(user, db)
+        finally:
+            event.remove(plan_engine.sync_engine, "before_cursor_execute", capture)
+
+    plans = []
+    async with plan_engine.connect() as conn:
+        for statement, parameters in captured:
+            rows = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            plans.append([row[-1] for row in rows if row[-1].startswith(("SCAN", "SEARCH"))])
+    assert plan_matches(plans, expected), plans
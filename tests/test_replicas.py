@@ -0,0 +1,61 @@
+"""
+Read routes go to the replica unless the client wrote recently: through the cookie, the header, or for bearer
+clients that send neither, by the user who wrote. The replica is a copy of the test database that does not
+receive later writes, like a lagging one.
+"""
+import shutil
+
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from benchmarks.bench_api import sqlite_engine, login
+from src.database import db as database_module
+from src.database.db import database, STICKY_HEADER
+from src.database.models import Contact
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def replica(engine, client, tmp_path):
+    path = tmp_path / "replica.db"
+    shutil.copy(engine.url.database, path)
+    replica = sqlite_engine(path)
+    database.__dict__["replica_sessions"] = [async_sessionmaker(replica, autoflush=False, expire_on_commit=False)]
+    database.__dict__["sticky_seconds"] = 5.0
+    yield replica
+    del database.__dict__["replica_sessions"], database.__dict__["sticky_seconds"]
+    database_module._sticky_users.clear()
+    client.cookies.clear()
+    await replica.dispose()
+
+
+async def test_reads_go_to_replica(client, replica):
+    async with replica.begin() as conn:
+        await conn.execute(insert(Contact).values(email="replica-only@example.com", phone="+1", person_id=51,
+                                                  user_id=2))
+    headers = {"Authorization": f"Bearer {await login(client, 2)}"}
+    # The login is a write too
+    client.cookies.clear()
+    response = await client.get("/api/contacts/search/", params={"find": "replica-only"}, headers=headers)
+    assert response.status_code == 200
+
+    response = await client.get("/api/contacts/search/", params={"find": "replica-only"},
+                                headers={**headers, STICKY_HEADER: "9999999999"})
+    assert response.status_code == 404
+
+
+async def test_bearer_client_reads_its_writes(client, headers, replica):
+    body = {"date_of_birth": "1990-05-17", "email": "written@example.com", "phone": "+15550001111", "person_id": 1}
+    response = await client.post("/api/contacts/", json=body, headers=headers)
+    assert response.status_code == 201
+    assert float(response.headers[STICKY_HEADER]) > 0
+    # No cookie and no header sent back, the user alone keeps the reads on the primary
+    client.cookies.clear()
+    response = await client.get("/api/contacts/search/", params={"find": "written@"}, headers=headers)
+    assert response.status_code == 200
+
+    database_module._sticky_users.clear()
+    response = await client.get("/api/contacts/search/", params={"find": "written@"}, headers=headers)
+    assert response.status_code == 404